@@ -0,0 +1,206 @@
+import sqlite3
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import time
+import argparse
+from datetime import datetime
+
+DB_PATH = 'tenants.db'
+BACKUP_DIR = 'backups'
+SNAPSHOT_PREFIX = 'tenants_'
+SNAPSHOT_SUFFIX = '.db.gz'
+# Copies taken just before a restore; kept out of list/prune so they survive retention
+PRE_RESTORE_PREFIX = 'pre_restore_'
+
+# Pages copied per backup step. Between steps the source lock is released so
+# the app can keep writing while a snapshot is in progress.
+PAGES_PER_STEP = 256
+STEP_SLEEP = 0.01
+
+
+def _copy_online(src, dst, pages=PAGES_PER_STEP, sleep=STEP_SLEEP):
+    # sqlite3's backup() calls sqlite3_backup_step(pages) in a loop and sleeps
+    # between steps; if a writer changes the source mid-copy, SQLite restarts
+    # the copy so the result is always a consistent snapshot.
+    src.backup(dst, pages=pages, sleep=sleep)
+
+
+def _check_integrity(path):
+    check = sqlite3.connect(path)
+    try:
+        result = check.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        check.close()
+    if result != 'ok':
+        raise sqlite3.DatabaseError(f"Integrity check failed for {path}: {result}")
+
+
+def create_backup(db_path=DB_PATH, backup_dir=BACKUP_DIR, keep=None, prefix=SNAPSHOT_PREFIX):
+    os.makedirs(backup_dir, exist_ok=True)
+    # Microseconds keep two snapshots taken in the same second (the backup
+    # thread and "Backup Now", or two restores) from sharing a name
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    snapshot_path = os.path.join(backup_dir, f"{prefix}{stamp}{SNAPSHOT_SUFFIX}")
+    # Write to a temporary name first so a crash never leaves a
+    # half-written file that looks like a valid snapshot.
+    fd, partial_path = tempfile.mkstemp(suffix=SNAPSHOT_SUFFIX + '.part', dir=backup_dir)
+    os.close(fd)
+
+    fd, tmp_path = tempfile.mkstemp(suffix='.db', dir=backup_dir)
+    os.close(fd)
+    try:
+        src = sqlite3.connect(db_path)
+        dst = sqlite3.connect(tmp_path)
+        try:
+            _copy_online(src, dst)
+        finally:
+            dst.close()
+            src.close()
+        _check_integrity(tmp_path)
+        with open(tmp_path, 'rb') as f_in, gzip.open(partial_path, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        # os.link fails if snapshot_path exists, where os.replace would
+        # silently overwrite an earlier snapshot
+        os.link(partial_path, snapshot_path)
+    finally:
+        for leftover in (tmp_path, partial_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    if keep:
+        prune_backups(backup_dir, keep)
+    return snapshot_path
+
+
+def list_backups(backup_dir=BACKUP_DIR):
+    if not os.path.isdir(backup_dir):
+        return []
+    names = [n for n in os.listdir(backup_dir)
+             if n.startswith(SNAPSHOT_PREFIX) and n.endswith(SNAPSHOT_SUFFIX)]
+    # Timestamps are zero-padded, so name order is chronological order
+    return [os.path.join(backup_dir, n) for n in sorted(names, reverse=True)]
+
+
+def prune_backups(backup_dir=BACKUP_DIR, keep=14):
+    removed = []
+    for path in list_backups(backup_dir)[keep:]:
+        os.remove(path)
+        removed.append(path)
+    return removed
+
+
+def restore_backup(snapshot_path, db_path=DB_PATH, backup_dir=BACKUP_DIR):
+    # Returns the path of a copy of db_path taken before restoring, so a
+    # wrong restore can itself be undone with restore_backup(that_path)
+    target_dir = os.path.dirname(os.path.abspath(db_path))
+    fd, tmp_path = tempfile.mkstemp(suffix='.db', dir=target_dir)
+    os.close(fd)
+    try:
+        with gzip.open(snapshot_path, 'rb') as f_in, open(tmp_path, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        _check_integrity(tmp_path)
+
+        safety_copy = None
+        if os.path.exists(db_path):
+            safety_copy = create_backup(db_path, backup_dir, prefix=PRE_RESTORE_PREFIX)
+
+        # Restore through the backup API rather than replacing the file, so
+        # connections already open on db_path see the restored data.
+        src = sqlite3.connect(tmp_path)
+        dst = sqlite3.connect(db_path)
+        try:
+            _copy_online(src, dst)
+        finally:
+            dst.close()
+            src.close()
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    _check_integrity(db_path)
+    return safety_copy
+
+
+def run_schedule(interval_hours=24, db_path=DB_PATH, backup_dir=BACKUP_DIR, keep=14, stop_event=None):
+    stop_event = stop_event or threading.Event()
+    # Retention counts snapshots, so a snapshot on every (re)start would push
+    # older ones out. Wait until the newest one is a full interval old.
+    snapshots = list_backups(backup_dir)
+    if snapshots:
+        age = time.time() - os.path.getmtime(snapshots[0])
+        stop_event.wait(max(0, interval_hours * 3600 - age))
+    while not stop_event.is_set():
+        try:
+            create_backup(db_path, backup_dir, keep=keep)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Backup failed: {e}")
+        stop_event.wait(interval_hours * 3600)
+
+
+def start_backup_thread(interval_hours=24, db_path=DB_PATH, backup_dir=BACKUP_DIR, keep=14):
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_schedule,
+        args=(interval_hours, db_path, backup_dir, keep, stop_event),
+        name="tenant-backup",
+        daemon=True
+    )
+    thread.start()
+    return thread, stop_event
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Online backups of the TenantTracker database")
+    parser.add_argument("--db", default=DB_PATH, help="Database file (default: tenants.db)")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="Backup directory (default: backups)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    create_p = sub.add_parser("create", help="Take a compressed snapshot now")
+    create_p.add_argument("--keep", type=int, default=None, help="Keep only the newest N snapshots")
+
+    sub.add_parser("list", help="List snapshots, newest first")
+
+    prune_p = sub.add_parser("prune", help="Delete all but the newest N snapshots")
+    prune_p.add_argument("--keep", type=int, default=14)
+
+    restore_p = sub.add_parser("restore", help="Verify a snapshot and restore it into --db")
+    restore_p.add_argument("snapshot", help="Snapshot file, or 'latest'")
+
+    schedule_p = sub.add_parser("schedule", help="Take snapshots on a fixed interval until stopped")
+    schedule_p.add_argument("--interval-hours", type=float, default=24)
+    schedule_p.add_argument("--keep", type=int, default=14)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "create":
+        print(create_backup(args.db, args.dir, keep=args.keep))
+    elif args.command == "list":
+        for path in list_backups(args.dir):
+            size_kb = os.path.getsize(path) / 1024
+            print(f"{path}\t{size_kb:,.1f} KB")
+    elif args.command == "prune":
+        for path in prune_backups(args.dir, args.keep):
+            print(f"Removed {path}")
+    elif args.command == "restore":
+        snapshot = args.snapshot
+        if snapshot == "latest":
+            backups = list_backups(args.dir)
+            if not backups:
+                parser.error(f"No snapshots found in {args.dir}")
+            snapshot = backups[0]
+        safety_copy = restore_backup(snapshot, args.db, args.dir)
+        print(f"Restored {snapshot} into {args.db}")
+        if safety_copy:
+            print(f"Previous database saved to {safety_copy}")
+    elif args.command == "schedule":
+        try:
+            run_schedule(args.interval_hours, args.db, args.dir, args.keep)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
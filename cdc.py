@@ -0,0 +1,219 @@
+import sqlite3
+import json
+import sys
+import argparse
+from datetime import datetime, timedelta
+
+DB_PATH = 'tenants.db'
+TRACKED_TABLES = ['tenants', 'payments', 'expenses', 'notes']
+DEFAULT_BATCH = 500
+
+
+def ensure_cdc_schema(conn):
+    cursor = conn.cursor()
+    # seq is AUTOINCREMENT so sequence numbers are never reused, even after
+    # compaction deletes the newest rows
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS change_events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        changed_columns TEXT,
+        row_data TEXT,
+        changed_at TEXT NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS cdc_consumers (
+        name TEXT PRIMARY KEY,
+        last_seq INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    )
+    ''')
+    for table in TRACKED_TABLES:
+        _ensure_triggers(cursor, table)
+    conn.commit()
+
+
+def _trigger_sql(table, columns):
+    row_json = "json_object(" + ", ".join(f"'{c}', NEW.\"{c}\"" for c in columns) + ")"
+    all_columns = json.dumps(columns).replace("'", "''")
+    changed = " || ".join(
+        f"CASE WHEN OLD.\"{c}\" IS NOT NEW.\"{c}\" THEN ',\"{c}\"' ELSE '' END" for c in columns)
+    any_changed = " OR ".join(f"OLD.\"{c}\" IS NOT NEW.\"{c}\"" for c in columns)
+    now = "strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime')"
+    return {
+        f"trg_cdc_{table}_insert": f'''CREATE TRIGGER trg_cdc_{table}_insert
+AFTER INSERT ON {table}
+BEGIN
+    INSERT INTO change_events (table_name, row_id, op, changed_columns, row_data, changed_at)
+    VALUES ('{table}', NEW.id, 'insert', '{all_columns}', {row_json}, {now});
+END''',
+        # Updates that change nothing (e.g. re-saving an unchanged form) are skipped
+        f"trg_cdc_{table}_update": f'''CREATE TRIGGER trg_cdc_{table}_update
+AFTER UPDATE ON {table}
+WHEN {any_changed}
+BEGIN
+    INSERT INTO change_events (table_name, row_id, op, changed_columns, row_data, changed_at)
+    VALUES ('{table}', NEW.id, 'update', '[' || substr({changed}, 2) || ']', {row_json}, {now});
+END''',
+        f"trg_cdc_{table}_delete": f'''CREATE TRIGGER trg_cdc_{table}_delete
+AFTER DELETE ON {table}
+BEGIN
+    INSERT INTO change_events (table_name, row_id, op, changed_columns, row_data, changed_at)
+    VALUES ('{table}', OLD.id, 'delete', NULL, NULL, {now});
+END'''
+    }
+
+
+def _ensure_triggers(cursor, table):
+    # Triggers list the table's columns, so they are rebuilt when a migration
+    # adds one. Comparing against sqlite_master keeps this a no-op otherwise,
+    # which matters because the app runs it on every rerun.
+    columns = [col[1] for col in cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+    existing = dict(cursor.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?", (table,)).fetchall())
+    for name, sql in _trigger_sql(table, columns).items():
+        if existing.get(name) != sql:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(sql)
+
+
+def _event(row):
+    seq, table_name, row_id, op, changed_columns, row_data, changed_at = row
+    return {
+        'seq': seq,
+        'table': table_name,
+        'row_id': row_id,
+        'op': op,
+        'changed_columns': json.loads(changed_columns) if changed_columns else None,
+        'row': json.loads(row_data) if row_data else None,
+        'changed_at': changed_at
+    }
+
+
+def read_changes(conn, since_seq=0, limit=DEFAULT_BATCH, tables=None):
+    # Events with seq > since_seq, oldest first. Uses the seq primary key, so
+    # cost depends on the batch size, not on how many events are stored.
+    query = '''
+        SELECT seq, table_name, row_id, op, changed_columns, row_data, changed_at
+        FROM change_events
+        WHERE seq > ?
+    '''
+    params = [since_seq]
+    if tables:
+        query += f" AND table_name IN ({', '.join('?' for _ in tables)})"
+        params.extend(tables)
+    query += " ORDER BY seq LIMIT ?"
+    params.append(limit)
+    return [_event(row) for row in conn.execute(query, params)]
+
+
+def latest_seq(conn):
+    # sqlite_sequence still holds the high-water mark after compaction
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_events'").fetchone()
+    return row[0] if row else 0
+
+
+def get_cursor(conn, consumer):
+    row = conn.execute("SELECT last_seq FROM cdc_consumers WHERE name = ?", (consumer,)).fetchone()
+    return row[0] if row else 0
+
+
+def commit_cursor(conn, consumer, seq):
+    # Cursors only move forward, so replaying an older batch is harmless
+    conn.execute('''
+        INSERT INTO cdc_consumers (name, last_seq, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET last_seq = MAX(last_seq, excluded.last_seq),
+                                        updated_at = excluded.updated_at
+    ''', (consumer, seq, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    conn.commit()
+
+
+def iter_batches(conn, consumer, batch_size=DEFAULT_BATCH, tables=None):
+    # Yields batches for a named consumer. The cursor advances only after the
+    # caller asks for the next batch, i.e. once the previous one was handled.
+    since = get_cursor(conn, consumer)
+    while True:
+        batch = read_changes(conn, since, batch_size, tables)
+        if not batch:
+            return
+        yield batch
+        since = batch[-1]['seq']
+        commit_cursor(conn, consumer, since)
+
+
+def compact(conn, keep_days=None):
+    # Deletes events every registered consumer has already read. With
+    # keep_days, events newer than that are kept regardless.
+    row = conn.execute("SELECT MIN(last_seq) FROM cdc_consumers").fetchone()
+    upto = row[0] if row and row[0] is not None else 0
+    query = "DELETE FROM change_events WHERE seq <= ?"
+    params = [upto]
+    if keep_days is not None:
+        cutoff = (datetime.now() - timedelta(days=keep_days)).strftime("%Y-%m-%d %H:%M:%S")
+        query += " AND changed_at < ?"
+        params.append(cutoff)
+    deleted = conn.execute(query, params).rowcount
+    conn.commit()
+    return deleted
+
+
+def status(conn):
+    consumers = conn.execute("SELECT name, last_seq, updated_at FROM cdc_consumers ORDER BY name").fetchall()
+    events, first_seq = conn.execute("SELECT COUNT(*), MIN(seq) FROM change_events").fetchone()
+    last_seq = latest_seq(conn)
+    return {'events': events, 'first_seq': first_seq, 'last_seq': last_seq,
+            'consumers': [{'name': n, 'last_seq': s, 'behind': last_seq - s, 'updated_at': u}
+                          for n, s, u in consumers]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Change events for incremental sync")
+    parser.add_argument("--db", default=DB_PATH, help="Database file (default: tenants.db)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    read_p = sub.add_parser("read", help="Print events after a sequence number as JSON lines")
+    read_p.add_argument("--since", type=int, default=0)
+    read_p.add_argument("--limit", type=int, default=DEFAULT_BATCH)
+    read_p.add_argument("--table", action="append", choices=TRACKED_TABLES)
+
+    consume_p = sub.add_parser("consume", help="Print new events for a named consumer and advance its cursor")
+    consume_p.add_argument("consumer")
+    consume_p.add_argument("--batch", type=int, default=DEFAULT_BATCH)
+    consume_p.add_argument("--max-batches", type=int, default=None)
+    consume_p.add_argument("--table", action="append", choices=TRACKED_TABLES)
+
+    compact_p = sub.add_parser("compact", help="Delete events all consumers have read")
+    compact_p.add_argument("--keep-days", type=int, default=None)
+
+    sub.add_parser("status", help="Show event counts and consumer positions")
+
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(args.db, timeout=30)
+    try:
+        ensure_cdc_schema(conn)
+        if args.command == "read":
+            for event in read_changes(conn, args.since, args.limit, args.table):
+                print(json.dumps(event))
+        elif args.command == "consume":
+            batches = iter_batches(conn, args.consumer, args.batch, args.table)
+            for i, batch in enumerate(batches):
+                for event in batch:
+                    print(json.dumps(event))
+                sys.stdout.flush()
+                if args.max_batches and i + 1 >= args.max_batches:
+                    # Acknowledge the last printed batch before stopping
+                    commit_cursor(conn, args.consumer, batch[-1]['seq'])
+                    break
+        elif args.command == "compact":
+            print(f"Deleted {compact(conn, args.keep_days)} events")
+        elif args.command == "status":
+            print(json.dumps(status(conn), indent=2))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
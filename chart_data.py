@@ -0,0 +1,146 @@
+import pandas as pd
+
+from reports import tenant_month_sql, month_params
+
+GROUP_OPTIONS = {
+    "Top tenants by arrears": "tenant",
+    "Property": "property",
+    "Unit group": "unit_group",
+    "Arrears bucket": "arrears_bucket"
+}
+
+# Upper bound on groups in the chart (top-N plus "Others"), which keeps the
+# embedded Vega-Lite dataset small no matter how many tenants are in a report.
+MAX_GROUPS = 30
+
+# Groupings whose number of groups grows with the data and so take a top-N;
+# arrears buckets are a fixed set
+TOP_N_GROUPS = {'tenant', 'property', 'unit_group'}
+
+CATEGORY_LABELS = {
+    'rent': 'Due',
+    'total_paid': 'Paid',
+    'balance': 'Arrears'
+}
+
+# Per-tenant totals for the month, the same figures as the Monthly Report
+# table; tenants with neither a lease nor a payment in the month are left out
+_TENANT_TOTALS = tenant_month_sql() + '''
+, tenant_totals AS (
+    SELECT t.id, t.name, COALESCE(due.unit, t.unit) AS unit, t.property_id,
+           COALESCE(due.rent_due, 0) AS rent,
+           COALESCE(paid.total_paid, 0) AS total_paid,
+           COALESCE(due.rent_due, 0) - COALESCE(paid.total_paid, 0) AS balance
+    FROM tenants t
+    LEFT JOIN due ON due.tenant_id = t.id
+    LEFT JOIN paid ON paid.tenant_id = t.id
+    WHERE t.property_id = COALESCE(:property_id, t.property_id)
+      AND (due.tenant_id IS NOT NULL OR paid.tenant_id IS NOT NULL)
+)
+'''
+
+_GROUP_QUERIES = {
+    # Top-N tenants by arrears, everyone else folded into one "Others" row
+    'tenant': _TENANT_TOTALS + '''
+    , ranked AS (
+        SELECT *, ROW_NUMBER() OVER (ORDER BY balance DESC, name) AS rank
+        FROM tenant_totals
+    )
+    SELECT CASE WHEN rank <= :top_n THEN name || COALESCE(' (' || NULLIF(TRIM(unit), '') || ')', '')
+                ELSE 'Others' END AS grp,
+           MIN(rank) AS sort_key,
+           COUNT(*) AS tenants,
+           SUM(rent) AS rent, SUM(total_paid) AS total_paid, SUM(balance) AS balance
+    FROM ranked
+    GROUP BY CASE WHEN rank <= :top_n THEN rank ELSE :top_n + 1 END
+    ORDER BY sort_key
+    ''',
+    'property': _TENANT_TOTALS + '''
+    SELECT COALESCE(pr.name, 'No property') AS grp,
+           -SUM(tt.balance) AS sort_key,
+           COUNT(*) AS tenants,
+           SUM(tt.rent) AS rent, SUM(tt.total_paid) AS total_paid, SUM(tt.balance) AS balance
+    FROM tenant_totals tt
+    LEFT JOIN properties pr ON pr.id = tt.property_id
+    GROUP BY tt.property_id
+    ORDER BY sort_key
+    ''',
+    # Unit group is the unit's leading word ("Block A 12" -> "Block", "A12" -> "A12"),
+    # which matches how block/floor-prefixed units are usually named
+    'unit_group': _TENANT_TOTALS + '''
+    , grouped AS (
+        SELECT *,
+               CASE WHEN unit IS NULL OR TRIM(unit) = '' THEN 'No unit'
+                    WHEN INSTR(TRIM(unit), ' ') > 0 THEN SUBSTR(TRIM(unit), 1, INSTR(TRIM(unit), ' ') - 1)
+                    ELSE TRIM(unit) END AS unit_group
+        FROM tenant_totals
+    )
+    SELECT unit_group AS grp,
+           -SUM(balance) AS sort_key,
+           COUNT(*) AS tenants,
+           SUM(rent) AS rent, SUM(total_paid) AS total_paid, SUM(balance) AS balance
+    FROM grouped
+    GROUP BY unit_group
+    ORDER BY sort_key
+    ''',
+    'arrears_bucket': _TENANT_TOTALS + '''
+    , bucketed AS (
+        SELECT *,
+               CASE WHEN balance <= 0 THEN 0
+                    WHEN balance <= 500 THEN 1
+                    WHEN balance <= 2000 THEN 2
+                    WHEN balance <= 5000 THEN 3
+                    ELSE 4 END AS bucket
+        FROM tenant_totals
+    )
+    SELECT CASE bucket WHEN 0 THEN 'Paid up'
+                       WHEN 1 THEN 'R1 – R500'
+                       WHEN 2 THEN 'R501 – R2,000'
+                       WHEN 3 THEN 'R2,001 – R5,000'
+                       ELSE 'Over R5,000' END AS grp,
+           bucket AS sort_key,
+           COUNT(*) AS tenants,
+           SUM(rent) AS rent, SUM(total_paid) AS total_paid, SUM(balance) AS balance
+    FROM bucketed
+    GROUP BY bucket
+    ORDER BY sort_key
+    '''
+}
+
+
+def _fold_others(df, max_groups):
+    # Property and unit groups are unbounded too; keep the biggest arrears
+    # and sum the rest into "Others"
+    if len(df) <= max_groups:
+        return df
+    head = df.iloc[:max_groups - 1]
+    tail = df.iloc[max_groups - 1:]
+    others = pd.DataFrame([{
+        'grp': 'Others',
+        'sort_key': tail['sort_key'].max(),
+        'tenants': tail['tenants'].sum(),
+        'rent': tail['rent'].sum(),
+        'total_paid': tail['total_paid'].sum(),
+        'balance': tail['balance'].sum()
+    }])
+    return pd.concat([head, others], ignore_index=True)
+
+
+def collection_chart_data(conn, month_year, property_id=None, group_by='tenant', top_n=15):
+    top_n = max(1, min(int(top_n), MAX_GROUPS - 1))
+    params = month_params(month_year,
+                          property_id=int(property_id) if property_id is not None else None,
+                          top_n=top_n)
+    df = pd.read_sql_query(_GROUP_QUERIES[group_by], conn, params=params)
+    if group_by in TOP_N_GROUPS:
+        df = _fold_others(df, top_n + 1)
+    df['order'] = range(len(df))
+
+    # Long format for Altair: at most MAX_GROUPS * 3 rows
+    chart_data = df.melt(id_vars=['grp', 'order', 'tenants'],
+                         value_vars=['rent', 'total_paid', 'balance'],
+                         var_name='Category',
+                         value_name='Amount (R)')
+    chart_data['Category'] = chart_data['Category'].map(CATEGORY_LABELS)
+    chart_data['Amount (R)'] = chart_data['Amount (R)'].round(2)
+    return chart_data.rename(columns={'grp': 'Group', 'tenants': 'Tenants'})
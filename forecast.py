@@ -0,0 +1,249 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from leases import first_counted_month
+
+MIN_HORIZON = 3
+MAX_HORIZON = 24
+HISTORY_MONTHS = 12
+# Tenants with little history are pulled towards their property's average
+# (and properties with none towards the portfolio's); PRIOR_WEIGHT is how many
+# months of evidence the average counts as.
+PRIOR_WEIGHT = 3
+DEFAULT_COLLECTION_RATE = 0.9
+# Share of promised arrears expected to arrive in the promised month
+PROMISE_KEEP_RATE = 0.6
+PROMISE_PATTERN = r'Promised payment date:\s*(\d{4}-\d{2}-\d{2})'
+
+
+def _month_index(dates, origin):
+    # Whole months between origin (datetime64[M]) and each date
+    return (dates.astype('datetime64[M]') - origin).astype(int)
+
+
+def _load_inputs(conn, history_start):
+    leases = pd.read_sql_query('''
+        SELECT l.tenant_id, l.property_id, l.rent, l.move_in, l.move_out
+        FROM leases l
+        WHERE l.move_out IS NULL OR l.move_out > ?
+        ORDER BY l.tenant_id, l.move_in, l.id
+    ''', conn, params=(history_start,))
+    payments = pd.read_sql_query('''
+        SELECT tenant_id, payment_date, month_year, amount
+        FROM payments
+        WHERE payment_date >= ?
+    ''', conn, params=(history_start,))
+    promises = pd.read_sql_query('''
+        SELECT n.tenant_id, n.note_text,
+               COALESCE((SELECT b.closing_balance FROM balance_snapshots b
+                         WHERE b.tenant_id = n.tenant_id
+                         ORDER BY b.month_start DESC LIMIT 1), 0) AS arrears
+        FROM notes n
+        WHERE n.note_type = 'Payment Excuse' AND n.note_text LIKE '%Promised payment date:%'
+    ''', conn)
+    expenses = pd.read_sql_query('''
+        SELECT property_id, month_year,
+               COALESCE(garden, 0) + COALESCE(electrical, 0) + COALESCE(other_maintenance, 0) AS total
+        FROM expenses
+    ''', conn)
+    properties = pd.read_sql_query("SELECT id, name FROM properties ORDER BY name", conn)
+    return leases, payments, promises, expenses, properties
+
+
+def _lease_months(leases, origin):
+    # First and last month position each lease is charged for, with one lease
+    # per tenant per month as in the reports
+    first = _month_index(pd.to_datetime(leases['move_in']).to_numpy(), origin)
+    last_day = pd.to_datetime(leases['move_out'].fillna('2262-01-01')) - pd.Timedelta(days=1)
+    last = _month_index(last_day.to_numpy(), origin)
+    return first_counted_month(leases['tenant_id'], first, last), last
+
+
+def _collection_rates(leases, payments, prop_rows, n_props, origin, n_hist):
+    # Per-tenant on-time and late collection shares over the last n_hist
+    # months, as tenant x month matrices reduced along the month axis. Rent
+    # due comes from whichever of the tenant's leases applies in each month,
+    # so a tenant's history follows them across renewals and rent changes.
+    # Returns the tenant of each lease row and per-tenant arrays.
+    tenant_ids = pd.Index(leases['tenant_id'].unique())
+    lease_tenant = tenant_ids.get_indexer(leases['tenant_id'])
+    n_tenants = len(tenant_ids)
+    rent = leases['rent'].to_numpy(dtype=float)
+    first, last = _lease_months(leases, origin)
+    months = np.arange(n_hist)
+    lease_active = (months[None, :] >= first[:, None]) & (months[None, :] <= last[:, None])
+    due = np.zeros((n_tenants, n_hist))
+    np.add.at(due, lease_tenant, rent[:, None] * lease_active)
+    active = due > 0
+
+    on_time = np.zeros((n_tenants, n_hist))
+    late = np.zeros((n_tenants, n_hist))
+    if not payments.empty and n_tenants:
+        rows = tenant_ids.get_indexer(payments['tenant_id'])
+        due_month = pd.to_datetime(payments['month_year'], format="%b %Y", errors='coerce')
+        paid_on = pd.to_datetime(payments['payment_date'], errors='coerce')
+        ok = (rows >= 0) & due_month.notna().to_numpy() & paid_on.notna().to_numpy()
+        rows = rows[ok]
+        due_idx = _month_index(due_month[ok].to_numpy(), origin)
+        paid_idx = _month_index(paid_on[ok].to_numpy(), origin)
+        amount = payments['amount'][ok].fillna(0).to_numpy(dtype=float)
+        in_window = (due_idx >= 0) & (due_idx < n_hist)
+        is_late = paid_idx > due_idx
+        np.add.at(on_time, (rows[in_window & ~is_late], due_idx[in_window & ~is_late]), amount[in_window & ~is_late])
+        np.add.at(late, (rows[in_window & is_late], due_idx[in_window & is_late]), amount[in_window & is_late])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        on_time_share = np.clip(on_time / due, 0, 1)
+        late_share = np.clip(late / due, 0, 1 - on_time_share)
+    on_time_share = np.where(active, on_time_share, 0)
+    late_share = np.where(active, late_share, 0)
+    partial = active & (on_time + late > 0) & (on_time + late < due)
+
+    n_obs = active.sum(axis=1)
+    on_time_sum = on_time_share.sum(axis=1)
+    late_sum = late_share.sum(axis=1)
+
+    # Each tenant belongs to the property of their latest lease (leases are
+    # loaded in move_in order, so that is the last row per tenant)
+    tenant_prop = np.zeros(n_tenants, dtype=int)
+    tenant_prop[lease_tenant] = prop_rows
+
+    # Property averages, then portfolio average as the prior for empty properties
+    prop_obs = np.bincount(tenant_prop, weights=n_obs, minlength=n_props)
+    prop_on_time = np.bincount(tenant_prop, weights=on_time_sum, minlength=n_props)
+    prop_late = np.bincount(tenant_prop, weights=late_sum, minlength=n_props)
+    total_obs = n_obs.sum()
+    portfolio_on_time = on_time_sum.sum() / total_obs if total_obs else DEFAULT_COLLECTION_RATE
+    portfolio_late = late_sum.sum() / total_obs if total_obs else 0.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prior_on_time = np.where(prop_obs > 0, prop_on_time / prop_obs, portfolio_on_time)[tenant_prop]
+        prior_late = np.where(prop_obs > 0, prop_late / prop_obs, portfolio_late)[tenant_prop]
+
+    on_time_rate = (on_time_sum + PRIOR_WEIGHT * prior_on_time) / (n_obs + PRIOR_WEIGHT)
+    late_rate = (late_sum + PRIOR_WEIGHT * prior_late) / (n_obs + PRIOR_WEIGHT)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        partial_rate = np.where(n_obs > 0, partial.sum(axis=1) / n_obs, np.nan)
+    return tenant_ids, lease_tenant, on_time_rate, late_rate, partial_rate, n_obs
+
+
+def _expense_trend(expenses, prop_index, n_props, origin, horizon_idx):
+    # Per-property least-squares line through the last HISTORY_MONTHS of
+    # monthly expense totals, solved for all properties at once
+    projected = np.zeros((n_props, len(horizon_idx)))
+    if expenses.empty:
+        return projected
+    month = pd.to_datetime(expenses['month_year'], format="%b %Y", errors='coerce')
+    rows = prop_index.get_indexer(expenses['property_id'])
+    ok = month.notna().to_numpy() & (rows >= 0)
+    idx = _month_index(month[ok].to_numpy(), origin)
+    rows = rows[ok]
+    window = idx >= 0
+    totals = np.zeros((n_props, HISTORY_MONTHS))
+    seen = np.zeros((n_props, HISTORY_MONTHS), dtype=bool)
+    in_range = window & (idx < HISTORY_MONTHS)
+    np.add.at(totals, (rows[in_range], idx[in_range]), expenses['total'].to_numpy(dtype=float)[ok][in_range])
+    seen[rows[in_range], idx[in_range]] = True
+
+    x = np.arange(HISTORY_MONTHS, dtype=float)[None, :]
+    w = seen.astype(float)
+    n = w.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean = (w * x).sum(axis=1) / n
+        y_mean = (w * totals).sum(axis=1) / n
+        cov = (w * (x - x_mean[:, None]) * (totals - y_mean[:, None])).sum(axis=1)
+        var = (w * (x - x_mean[:, None]) ** 2).sum(axis=1)
+        slope = np.where(var > 0, cov / var, 0.0)
+    intercept = y_mean - slope * x_mean
+    # Fewer than three months of data: use the average rather than a trend
+    slope = np.where(n >= 3, slope, 0.0)
+    intercept = np.where(n >= 3, intercept, y_mean)
+    projected = intercept[:, None] + slope[:, None] * horizon_idx[None, :]
+    return np.where(n[:, None] > 0, np.clip(projected, 0, None), 0.0)
+
+
+def forecast_cash_flow(conn, horizon=12, today=None):
+    # Expected collections and net cash flow per property for the `horizon`
+    # months after the current one. Returns (forecast, tenant_rates).
+    horizon = int(min(max(horizon, MIN_HORIZON), MAX_HORIZON))
+    today = pd.Timestamp(today or datetime.now()).normalize()
+    current = np.datetime64(today.strftime("%Y-%m"), 'M')
+    origin = current - HISTORY_MONTHS
+    history_start = str(origin) + "-01"
+
+    leases, payments, promises, expenses, properties = _load_inputs(conn, history_start)
+    n_props = len(properties)
+    prop_index = pd.Index(properties['id'])
+    forecast_months = current + 1 + np.arange(horizon)
+    # Month positions relative to origin: history is 0..HISTORY_MONTHS-1, the
+    # current month is HISTORY_MONTHS, the forecast follows
+    horizon_idx = HISTORY_MONTHS + 1 + np.arange(horizon)
+
+    leases = leases[prop_index.get_indexer(leases['property_id']) >= 0].reset_index(drop=True)
+    prop_rows = prop_index.get_indexer(leases['property_id'])
+    rent = leases['rent'].to_numpy(dtype=float)
+
+    tenant_ids, lease_tenant, on_time_rate, late_rate, partial_rate, n_obs = _collection_rates(
+        leases, payments, prop_rows, n_props, origin, HISTORY_MONTHS)
+
+    # Scheduled rent, T x (horizon + 1): column 0 is the current month so late
+    # payments on it land in the first forecast month
+    first, last = _lease_months(leases, origin)
+    cols = HISTORY_MONTHS + np.arange(horizon + 1)
+    scheduled = rent[:, None] * ((cols[None, :] >= first[:, None]) & (cols[None, :] <= last[:, None]))
+    # Every lease of a tenant is forecast with that tenant's rates
+    collected = (scheduled[:, 1:] * on_time_rate[lease_tenant, None]
+                 + scheduled[:, :-1] * late_rate[lease_tenant, None])
+
+    expected_rent = np.zeros((n_props, horizon))
+    expected_collections = np.zeros((n_props, horizon))
+    np.add.at(expected_rent, prop_rows, scheduled[:, 1:])
+    np.add.at(expected_collections, prop_rows, collected)
+
+    # Outstanding promises: the tenant's latest closing arrears, discounted,
+    # in the month they promised to pay
+    promised = np.zeros((n_props, horizon))
+    if not promises.empty and len(leases):
+        tenant_prop = pd.Series(prop_rows, index=leases['tenant_id']).groupby(level=0).last()
+        promise_date = pd.to_datetime(promises['note_text'].str.extract(PROMISE_PATTERN)[0], errors='coerce')
+        rows = promises['tenant_id'].map(tenant_prop)
+        ok = (promise_date >= today) & rows.notna() & (promises['arrears'] > 0)
+        # One promise per tenant counts: the latest one made
+        latest = promise_date[ok].groupby(promises['tenant_id'][ok]).max()
+        if not latest.empty:
+            p_rows = latest.index.map(tenant_prop).to_numpy(dtype=int)
+            p_idx = _month_index(latest.to_numpy(), current) - 1
+            arrears = promises[ok].groupby('tenant_id')['arrears'].max().reindex(latest.index).to_numpy(dtype=float)
+            in_horizon = (p_idx >= 0) & (p_idx < horizon)
+            np.add.at(promised, (p_rows[in_horizon], p_idx[in_horizon]), arrears[in_horizon] * PROMISE_KEEP_RATE)
+
+    expected_expenses = _expense_trend(expenses, prop_index, n_props, origin, horizon_idx)
+    inflow = expected_collections + promised
+    net = inflow - expected_expenses
+
+    month_labels = pd.to_datetime(forecast_months.astype('datetime64[D]'))
+    forecast = pd.DataFrame({
+        'property_id': np.repeat(properties['id'].to_numpy(), horizon),
+        'name': np.repeat(properties['name'].to_numpy(), horizon),
+        'month': np.tile(month_labels, n_props),
+        'month_year': np.tile(month_labels.strftime("%b %Y"), n_props),
+        'scheduled_rent': expected_rent.ravel().round(2),
+        'expected_collections': expected_collections.ravel().round(2),
+        'promised': promised.ravel().round(2),
+        'expected_expenses': expected_expenses.ravel().round(2),
+        'net_cash_flow': net.ravel().round(2)
+    })
+
+    # One row per tenant, with the property and rent of their latest lease
+    latest_lease = np.zeros(len(tenant_ids), dtype=int)
+    latest_lease[lease_tenant] = np.arange(len(leases))
+    tenant_rates = pd.DataFrame({
+        'tenant_id': tenant_ids.to_numpy(),
+        'property_id': leases['property_id'].to_numpy()[latest_lease],
+        'rent': rent[latest_lease],
+        'months_observed': n_obs,
+        'on_time_rate': on_time_rate.round(3),
+        'late_rate': late_rate.round(3),
+        'partial_rate': np.round(partial_rate, 3)
+    })
+    return forecast, tenant_rates
@@ -0,0 +1,229 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+from reports import month_bounds, tenant_month_sql
+
+OPEN_ENDED = '9999-12-31'
+
+
+def ensure_leases_schema(conn):
+    cursor = conn.cursor()
+    created = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'leases'").fetchone() is None
+    # move_in is the first occupied day and move_out the day the unit is free
+    # again; an open lease has move_out NULL. Dates are stored as YYYY-MM-DD.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS leases (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tenant_id INTEGER NOT NULL,
+        property_id INTEGER,
+        unit TEXT,
+        rent REAL NOT NULL,
+        move_in TEXT NOT NULL,
+        move_out TEXT,
+        FOREIGN KEY (tenant_id) REFERENCES tenants(id),
+        FOREIGN KEY (property_id) REFERENCES properties(id)
+    )
+    ''')
+    # Overlap with [start, end) is move_in < end AND move_out > start: the
+    # first index serves range scans on move_in per property, the second
+    # serves the move_out side and open-lease lookups.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leases_property_move_in ON leases(property_id, move_in)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leases_move_out ON leases(move_out, move_in)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leases_tenant ON leases(tenant_id)")
+
+    # One-time migration: tenants created before leases existed get an open
+    # lease starting at their first payment (or today if they never paid).
+    # It runs only in the call that creates the table, so a tenant added
+    # later is never backfilled alongside the lease start_lease gives it.
+    if created:
+        today = datetime.now().strftime("%Y-%m-%d")
+        cursor.execute('''
+            INSERT INTO leases (tenant_id, property_id, unit, rent, move_in, move_out)
+            SELECT t.id, t.property_id, t.unit, t.rent,
+                   COALESCE((SELECT MIN(p.payment_date) FROM payments p WHERE p.tenant_id = t.id), ?),
+                   NULL
+            FROM tenants t
+            WHERE NOT EXISTS (SELECT 1 FROM leases l WHERE l.tenant_id = t.id)
+        ''', (today,))
+    conn.commit()
+
+
+def start_lease(conn, tenant_id, property_id, unit, rent, move_in, commit=True):
+    # commit=False leaves the transaction open, so a new tenant and its first
+    # lease can be committed together
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO leases (tenant_id, property_id, unit, rent, move_in)
+        VALUES (?, ?, ?, ?, ?)
+    """, (tenant_id, property_id, unit, rent, move_in))
+    if commit:
+        conn.commit()
+    return cursor.lastrowid
+
+
+def change_lease_terms(conn, tenant_id, unit, rent, effective):
+    # A rent or unit change ends the open lease on `effective` and starts a
+    # new one from that day, so earlier months keep the terms that applied
+    # then. Changes dated on or before the lease start are corrections and
+    # are applied to the open lease in place. Rent is charged from the lease
+    # in force at the start of each month, so a mid-month change is billed
+    # from the next month.
+    lease = conn.execute("""
+        SELECT id, property_id, unit, rent, move_in FROM leases
+        WHERE tenant_id=? AND move_out IS NULL
+        ORDER BY move_in DESC LIMIT 1
+    """, (tenant_id,)).fetchone()
+    if lease is None:
+        return None
+    lease_id, property_id, old_unit, old_rent, move_in = lease
+    if (old_unit or "") == (unit or "") and old_rent == rent:
+        return lease_id
+
+    cursor = conn.cursor()
+    if effective <= move_in:
+        cursor.execute("UPDATE leases SET unit=?, rent=? WHERE id=?", (unit, rent, lease_id))
+        conn.commit()
+        return lease_id
+    cursor.execute("UPDATE leases SET move_out=? WHERE id=?", (effective, lease_id))
+    cursor.execute("""
+        INSERT INTO leases (tenant_id, property_id, unit, rent, move_in)
+        VALUES (?, ?, ?, ?, ?)
+    """, (tenant_id, property_id, unit, rent, effective))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def end_lease(conn, tenant_id, move_out):
+    row = conn.execute("""
+        SELECT MAX(move_in) FROM leases
+        WHERE tenant_id=? AND move_out IS NULL
+    """, (tenant_id,)).fetchone()
+    if row and row[0] is not None and move_out < row[0]:
+        raise ValueError(f"Move-out date {move_out} is before the lease start {row[0]}")
+    conn.execute("""
+        UPDATE leases SET move_out=?
+        WHERE tenant_id=? AND move_out IS NULL
+    """, (move_out, tenant_id))
+    conn.commit()
+
+
+def get_current_lease(conn, tenant_id):
+    return pd.read_sql_query('''
+        SELECT * FROM leases
+        WHERE tenant_id = ? AND move_out IS NULL
+        ORDER BY move_in DESC LIMIT 1
+    ''', conn, params=(tenant_id,))
+
+
+def first_counted_month(tenant_ids, first, last):
+    # Vectorised form of the one-lease-per-tenant-per-month rule in
+    # reports.TENANT_MONTH_TOTALS. Leases must be in tenant, move_in order;
+    # first/last are inclusive month positions. Each lease starts counting
+    # after the months its tenant's earlier leases already cover.
+    tenants = np.asarray(tenant_ids)
+    last = pd.Series(np.asarray(last))
+    covered_through = last.groupby(tenants).cummax().groupby(tenants).shift(1).to_numpy()
+    first = np.asarray(first)
+    return np.where(np.isnan(covered_through), first,
+                    np.maximum(first, np.nan_to_num(covered_through) + 1)).astype(int)
+
+
+def occupancy_between(conn, start, end):
+    # Portfolio occupancy and rent roll for [start, end): tenants with a lease
+    # in the period and their rent, counted as the reports count them
+    return pd.read_sql_query(tenant_month_sql("""
+months AS (
+    SELECT NULL AS month_year, :start AS month_start, :end AS month_end
+)""") + '''
+        SELECT pr.id AS property_id, pr.name, pr.total_units,
+               COUNT(due.tenant_id) AS occupied,
+               COALESCE(SUM(due.rent_due), 0) AS rent_roll,
+               CASE WHEN pr.total_units > 0
+                    THEN COUNT(due.tenant_id) * 100.0 / pr.total_units ELSE 0 END AS occupancy
+        FROM properties pr
+        LEFT JOIN due ON due.property_id = pr.id
+        GROUP BY pr.id
+        ORDER BY pr.name
+    ''', conn, params={'start': start, 'end': end})
+
+
+def occupancy_on(conn, date=None):
+    date = date or datetime.now().strftime("%Y-%m-%d")
+    next_day = (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    return occupancy_between(conn, date, next_day)
+
+
+def occupancy_for_month(conn, month_year):
+    start, end = month_bounds(month_year)
+    return occupancy_between(conn, start, end)
+
+
+def monthly_occupancy(conn, start_month, end_month):
+    # Occupancy and rent roll per property and month, for months
+    # start_month..end_month inclusive ("Jan 2024" style). A tenant counts
+    # once per month, under the earliest of their leases in force that month.
+    #
+    # Each lease adds +1 (and +rent) at its first month and -1 after its last
+    # month on a property x month grid; a cumulative sum along the months axis
+    # then gives the active count, so cost is O(leases + properties * months).
+    first = np.datetime64(datetime.strptime(start_month, "%b %Y"), 'M')
+    last = np.datetime64(datetime.strptime(end_month, "%b %Y"), 'M')
+    n_months = int((last - first).astype(int)) + 1
+    months = first + np.arange(max(n_months, 0))
+
+    properties = pd.read_sql_query("SELECT id, name, total_units FROM properties ORDER BY name", conn)
+    range_end = str(last + 1) + '-01'
+    leases = pd.read_sql_query('''
+        SELECT tenant_id, property_id, rent, move_in, MIN(COALESCE(move_out, ?), ?) AS move_out
+        FROM leases
+        WHERE move_in < ? AND (move_out IS NULL OR move_out > ?)
+        ORDER BY tenant_id, move_in, id
+    ''', conn, params=(OPEN_ENDED, range_end, range_end, str(first) + '-01'))
+
+    if n_months <= 0 or properties.empty:
+        return pd.DataFrame(columns=['property_id', 'name', 'month', 'month_year', 'total_units',
+                                     'occupied', 'rent_roll', 'occupancy'])
+
+    prop_index = pd.Index(properties['id'])
+    rows = prop_index.get_indexer(leases['property_id'])
+    keep = rows >= 0
+    rows = rows[keep]
+    rent = leases['rent'].to_numpy(dtype=float)[keep]
+    move_in = pd.to_datetime(leases['move_in'][keep]).to_numpy().astype('datetime64[M]')
+    # move_out is exclusive, so the last occupied month is the month of the day before
+    last_day = pd.to_datetime(leases['move_out'][keep]) - pd.Timedelta(days=1)
+    move_out = last_day.to_numpy().astype('datetime64[M]')
+
+    start_idx = np.clip((move_in - first).astype(int), 0, n_months)
+    end_idx = np.clip((move_out - first).astype(int) + 1, 0, n_months)
+    start_idx = first_counted_month(leases['tenant_id'][keep], start_idx, end_idx - 1)
+    valid = end_idx > start_idx
+
+    n_props = len(properties)
+    counts = np.zeros((n_props, n_months + 1))
+    rents = np.zeros((n_props, n_months + 1))
+    np.add.at(counts, (rows[valid], start_idx[valid]), 1)
+    np.add.at(counts, (rows[valid], end_idx[valid]), -1)
+    np.add.at(rents, (rows[valid], start_idx[valid]), rent[valid])
+    np.add.at(rents, (rows[valid], end_idx[valid]), -rent[valid])
+    occupied = np.cumsum(counts, axis=1)[:, :n_months]
+    rent_roll = np.cumsum(rents, axis=1)[:, :n_months]
+
+    total_units = properties['total_units'].to_numpy(dtype=float)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        occupancy = np.where(total_units > 0, occupied / total_units * 100, 0.0)
+
+    month_labels = pd.to_datetime(months.astype('datetime64[D]'))
+    result = pd.DataFrame({
+        'property_id': np.repeat(properties['id'].to_numpy(), n_months),
+        'name': np.repeat(properties['name'].to_numpy(), n_months),
+        'month': np.tile(month_labels, n_props),
+        'month_year': np.tile(month_labels.strftime("%b %Y"), n_props),
+        'total_units': np.repeat(properties['total_units'].to_numpy(), n_months),
+        'occupied': occupied.ravel().round().astype(int),
+        'rent_roll': rent_roll.ravel().round(2),
+        'occupancy': occupancy.ravel()
+    })
+    return result
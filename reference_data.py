@@ -0,0 +1,66 @@
+import threading
+from reports import get_data_version
+
+
+class ReferenceData:
+    # Hash maps over properties and tenants for selectors and label lookups.
+    # Built from two queries; every lookup afterwards is a dict access.
+
+    def __init__(self, conn, version):
+        self.version = version
+
+        self.properties = {}
+        self.property_ids_by_name = {}
+        self.property_ids = []
+        for pid, name, total_units, location, address in conn.execute(
+                "SELECT id, name, total_units, location, address FROM properties ORDER BY name"):
+            self.properties[pid] = {'id': pid, 'name': name, 'total_units': total_units,
+                                    'location': location, 'address': address}
+            self.property_ids_by_name.setdefault(name, pid)
+            self.property_ids.append(pid)
+
+        self.tenants = {}
+        self.tenant_ids_by_name = {}
+        self.tenant_ids_by_property = {}
+        self.tenant_ids = []
+        for tid, property_id, name, unit, rent, email, phone in conn.execute(
+                "SELECT id, property_id, name, unit, rent, email, phone FROM tenants ORDER BY name"):
+            self.tenants[tid] = {'id': tid, 'property_id': property_id, 'name': name, 'unit': unit,
+                                 'rent': rent, 'email': email, 'phone': phone,
+                                 'label': f"{name} ({unit or 'No unit'})"}
+            self.tenant_ids_by_name.setdefault(name, tid)
+            self.tenant_ids_by_property.setdefault(property_id, []).append(tid)
+            self.tenant_ids.append(tid)
+
+    def property_name(self, property_id):
+        prop = self.properties.get(property_id)
+        return prop['name'] if prop else f"Property {property_id}"
+
+    def tenant_label(self, tenant_id):
+        tenant = self.tenants.get(tenant_id)
+        return tenant['label'] if tenant else f"Tenant {tenant_id}"
+
+    def tenant_options(self, property_id=None):
+        if property_id:
+            return self.tenant_ids_by_property.get(property_id, [])
+        return self.tenant_ids
+
+
+_registries = {}
+_lock = threading.Lock()
+
+
+def get_reference_data(conn, key='tenants.db'):
+    # One registry per database, shared by every session in the process.
+    # data_version is bumped by triggers on every write (from the app or a
+    # sidecar), so a single-row read tells us whether to rebuild.
+    version = get_data_version(conn)
+    registry = _registries.get(key)
+    if registry is not None and registry.version == version:
+        return registry
+    with _lock:
+        registry = _registries.get(key)
+        if registry is None or registry.version != version:
+            registry = ReferenceData(conn, version)
+            _registries[key] = registry
+    return registry
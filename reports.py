@@ -0,0 +1,230 @@
+import io
+import pandas as pd
+from datetime import datetime
+
+# Tables whose writes change report results. Any insert, update or delete
+# bumps data_version, which invalidates everything in report_cache.
+VERSIONED_TABLES = ['properties', 'tenants', 'payments', 'expenses', 'leases']
+
+
+def ensure_reports_schema(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+    for table in VERSIONED_TABLES:
+        for op in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{op.lower()}_version
+            AFTER {op} ON {table}
+            BEGIN
+                UPDATE data_version SET version = version + 1 WHERE id = 1;
+            END
+            ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS report_cache (
+        report TEXT NOT NULL,
+        month_year TEXT NOT NULL,
+        property_id INTEGER NOT NULL DEFAULT 0,
+        data_version INTEGER NOT NULL,
+        generated_at TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        PRIMARY KEY (report, month_year, property_id)
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS balance_snapshots (
+        tenant_id INTEGER NOT NULL,
+        property_id INTEGER,
+        month_year TEXT NOT NULL,
+        month_start TEXT NOT NULL,
+        rent_due REAL NOT NULL,
+        paid REAL NOT NULL,
+        balance_brought_forward REAL NOT NULL,
+        closing_balance REAL NOT NULL,
+        closed_at TEXT NOT NULL,
+        PRIMARY KEY (tenant_id, month_year),
+        FOREIGN KEY (tenant_id) REFERENCES tenants(id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_balance_snapshots_month ON balance_snapshots(month_start, property_id)")
+    # Report queries filter payments and expenses by month_year
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_month_tenant ON payments(month_year, tenant_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_expenses_month_property ON expenses(month_year, property_id)")
+    conn.commit()
+
+
+def get_data_version(conn):
+    row = conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+def month_start(month_year):
+    return datetime.strptime(month_year, "%b %Y").strftime("%Y-%m-01")
+
+
+def month_bounds(month_year):
+    # [start, end) of the month as YYYY-MM-DD, the form lease overlap uses
+    start = month_start(month_year)
+    end = (pd.Timestamp(start) + pd.DateOffset(months=1)).strftime("%Y-%m-%d")
+    return start, end
+
+
+# Rent due and payments per tenant and month, the figures every report,
+# chart, statement and month close charges from. Queries supply a `months`
+# CTE with (month_year, month_start, month_end); SINGLE_MONTH binds one month
+# from month_params(). `due` has one row per tenant and month, `paid` one row
+# per tenant and month with payments.
+#
+# A tenant is charged for one lease per month: the earliest one in force in
+# that month. A rent or unit change dated mid-month therefore applies from the
+# next month, and the tenant is never counted (or charged) twice.
+SINGLE_MONTH = '''
+months AS (
+    SELECT :month_year AS month_year, :start AS month_start, :end AS month_end
+)'''
+
+TENANT_MONTH_TOTALS = '''
+month_leases AS (
+    SELECT l.tenant_id, l.property_id, l.unit, l.rent, m.month_year, m.month_start,
+           ROW_NUMBER() OVER (PARTITION BY l.tenant_id, m.month_year ORDER BY l.move_in, l.id) AS lease_rank
+    FROM leases l
+    JOIN months m
+      ON l.move_in < m.month_end
+     AND (l.move_out IS NULL OR l.move_out > m.month_start)
+),
+due AS (
+    SELECT tenant_id, month_year, month_start, property_id, unit, rent AS rent_due
+    FROM month_leases
+    WHERE lease_rank = 1
+),
+paid AS (
+    SELECT p.tenant_id, m.month_year, m.month_start, SUM(p.amount) AS total_paid
+    FROM payments p
+    JOIN months m ON m.month_year = p.month_year
+    GROUP BY p.tenant_id, m.month_year
+)'''
+
+
+def tenant_month_sql(months=SINGLE_MONTH):
+    # Opening WITH clause defining months, due and paid; callers append their
+    # own ", name AS (...)" CTEs and the final statement
+    return "WITH " + months.strip() + ",\n" + TENANT_MONTH_TOTALS.strip() + "\n"
+
+
+def month_params(month_year, **params):
+    start, end = month_bounds(month_year)
+    return {'month_year': month_year, 'start': start, 'end': end, **params}
+
+
+def dashboard_summary(conn, month_year):
+    # One row per property: tenants with a lease in the month and their rent,
+    # payments received for the month and recorded expenses, in a single pass
+    return pd.read_sql_query(tenant_month_sql() + '''
+        , occ AS (
+            SELECT property_id, COUNT(*) AS occupied, SUM(rent_due) AS potential
+            FROM due
+            GROUP BY property_id
+        ),
+        collected AS (
+            SELECT property_id, SUM(amount) AS actual
+            FROM payments
+            WHERE month_year = :month_year
+            GROUP BY property_id
+        ),
+        exp AS (
+            SELECT property_id,
+                   SUM(COALESCE(garden, 0) + COALESCE(electrical, 0) + COALESCE(other_maintenance, 0)) AS expenses
+            FROM expenses
+            WHERE month_year = :month_year
+            GROUP BY property_id
+        )
+        SELECT pr.id, pr.name, pr.total_units,
+               COALESCE(occ.occupied, 0) AS occupied,
+               CASE WHEN pr.total_units > 0
+                    THEN COALESCE(occ.occupied, 0) * 100.0 / pr.total_units ELSE 0 END AS occupancy,
+               COALESCE(occ.potential, 0) AS potential,
+               COALESCE(collected.actual, 0) AS actual,
+               COALESCE(exp.expenses, 0) AS expenses,
+               COALESCE(collected.actual, 0) - COALESCE(exp.expenses, 0) AS net
+        FROM properties pr
+        LEFT JOIN occ ON occ.property_id = pr.id
+        LEFT JOIN collected ON collected.property_id = pr.id
+        LEFT JOIN exp ON exp.property_id = pr.id
+        ORDER BY pr.id
+    ''', conn, params=month_params(month_year))
+
+
+def monthly_report(conn, month_year, property_id=None):
+    # Rent due comes from the tenant's leases in the month, as on the
+    # Dashboard, so tenants who have moved out are not charged. Tenants show
+    # up if they had a lease in the month or paid towards it.
+    query = tenant_month_sql() + '''
+    SELECT t.id, t.name, COALESCE(due.unit, t.unit) AS unit,
+           COALESCE(due.rent_due, 0) AS rent, t.phone, t.email,
+           COALESCE(paid.total_paid, 0) AS total_paid,
+           COALESCE(due.rent_due, 0) - COALESCE(paid.total_paid, 0) AS balance,
+           CASE WHEN COALESCE(due.rent_due, 0) - COALESCE(paid.total_paid, 0) > 0 THEN 'Overdue'
+                WHEN COALESCE(due.rent_due, 0) - COALESCE(paid.total_paid, 0) = 0 THEN 'Paid'
+                ELSE 'Overpaid' END AS status,
+           :month_year AS month_year
+    FROM tenants t
+    LEFT JOIN due ON due.tenant_id = t.id
+    LEFT JOIN paid ON paid.tenant_id = t.id
+    WHERE t.property_id = COALESCE(:property_id, t.property_id)
+      AND (due.tenant_id IS NOT NULL OR paid.tenant_id IS NOT NULL)
+    ORDER BY t.name
+    '''
+    property_id = int(property_id) if property_id is not None else None
+    return pd.read_sql_query(query, conn, params=month_params(month_year, property_id=property_id))
+
+
+REPORTS = {
+    'dashboard': lambda conn, month_year, property_id: dashboard_summary(conn, month_year),
+    'monthly_report': monthly_report
+}
+
+
+def cached_report(conn, report, month_year, property_id=None, store=True):
+    # Returns the stored result if nothing has been written since it was
+    # generated, otherwise recomputes it (and stores it unless conn is a
+    # read-only snapshot)
+    key_property = int(property_id) if property_id is not None else 0
+    version = get_data_version(conn)
+    row = conn.execute('''
+        SELECT payload FROM report_cache
+        WHERE report = ? AND month_year = ? AND property_id = ? AND data_version = ?
+    ''', (report, month_year, key_property, version)).fetchone()
+    if row:
+        return pd.read_json(io.StringIO(row[0]), orient='split', dtype=False, convert_dates=False)
+    if not store:
+        return REPORTS[report](conn, month_year, property_id)
+    return refresh_report(conn, report, month_year, property_id, version)
+
+
+def refresh_report(conn, report, month_year, property_id=None, version=None):
+    version = get_data_version(conn) if version is None else version
+    df = REPORTS[report](conn, month_year, property_id)
+    conn.execute('''
+        INSERT OR REPLACE INTO report_cache (report, month_year, property_id, data_version, generated_at, payload)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (report, month_year, int(property_id) if property_id is not None else 0, version,
+          datetime.now().strftime("%Y-%m-%d %H:%M:%S"), df.to_json(orient='split', index=False)))
+    conn.commit()
+    return df
+
+
+def report_cache_status(conn):
+    return pd.read_sql_query('''
+        SELECT report, month_year, property_id, generated_at,
+               data_version = (SELECT version FROM data_version WHERE id = 1) AS fresh
+        FROM report_cache
+        ORDER BY generated_at DESC
+    ''', conn)
+
@@ -0,0 +1,344 @@
+import sqlite3
+import threading
+import time
+import argparse
+import traceback
+import pandas as pd
+from datetime import datetime
+
+from leases import ensure_leases_schema
+from reports import ensure_reports_schema, cached_report, get_data_version, month_start, month_params, tenant_month_sql
+
+DB_PATH = 'tenants.db'
+POLL_SECONDS = 60
+WARM_INTERVAL_SECONDS = 15 * 60
+
+# Recurring jobs keep only their most recent runs in job_runs; warm_reports
+# runs every 15 minutes, so 96 is the last day. Jobs not listed keep all runs.
+RUNS_KEPT = {'warm_reports': 96}
+
+# Tenants per month-close transaction. Each batch commits on its own so the
+# write lock is only ever held for a fraction of a second.
+MONTH_CLOSE_BATCH = 500
+
+
+def connect(db_path=DB_PATH):
+    # Background jobs wait for the app's writes rather than failing on a busy lock
+    return sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+
+
+def ensure_scheduler_schema(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS job_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job TEXT NOT NULL,
+        run_key TEXT,
+        started_at TEXT NOT NULL,
+        finished_at TEXT,
+        status TEXT NOT NULL,
+        detail TEXT
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_runs_job ON job_runs(job, status, run_key)")
+    conn.commit()
+
+
+def previous_month(now=None):
+    now = now or datetime.now()
+    return (pd.Timestamp(now.replace(day=1)) - pd.DateOffset(months=1)).strftime("%b %Y")
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _record_start(conn, job, run_key):
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO job_runs (job, run_key, started_at, status)
+        VALUES (?, ?, ?, 'running')
+    """, (job, run_key, _now()))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def _record_finish(conn, run_id, status, detail):
+    conn.execute("""
+        UPDATE job_runs SET finished_at=?, status=?, detail=?
+        WHERE id=?
+    """, (_now(), status, detail, run_id))
+    conn.commit()
+
+
+def prune_job_runs(conn, job, keep):
+    cursor = conn.execute("""
+        DELETE FROM job_runs
+        WHERE job=? AND id <= (SELECT id FROM job_runs WHERE job=? ORDER BY id DESC LIMIT 1 OFFSET ?)
+    """, (job, job, keep))
+    conn.commit()
+    return cursor.rowcount
+
+
+def get_job_history(conn, limit=50):
+    return pd.read_sql_query('''
+        SELECT job, run_key, started_at, finished_at, status, detail
+        FROM job_runs
+        ORDER BY id DESC
+        LIMIT ?
+    ''', conn, params=(limit,))
+
+
+# ────────────────────────────────────────────────
+# JOBS
+# ────────────────────────────────────────────────
+def month_close(conn, month_year):
+    # Snapshot every tenant's position for month_year: rent due and payments
+    # as the reports compute them, and the closing balance carried forward
+    # from the latest earlier snapshot
+    params = month_params(month_year, closed_at=_now())
+
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM tenants").fetchone()[0]
+    tenants_closed = 0
+    for low in range(0, max_id, MONTH_CLOSE_BATCH):
+        # The WITH goes after INSERT so cursor.rowcount is reported
+        cursor = conn.execute('''
+            INSERT OR REPLACE INTO balance_snapshots
+                (tenant_id, property_id, month_year, month_start, rent_due, paid,
+                 balance_brought_forward, closing_balance, closed_at)
+            ''' + tenant_month_sql() + '''
+            SELECT id, property_id, :month_year, :start, rent_due, paid,
+                   brought_forward, brought_forward + rent_due - paid, :closed_at
+            FROM (
+                SELECT t.id, t.property_id,
+                       COALESCE(due.rent_due, 0) AS rent_due,
+                       COALESCE(paid.total_paid, 0) AS paid,
+                       COALESCE((SELECT b.closing_balance FROM balance_snapshots b
+                                 WHERE b.tenant_id = t.id AND b.month_start < :start
+                                 ORDER BY b.month_start DESC LIMIT 1), 0) AS brought_forward
+                FROM tenants t
+                LEFT JOIN due ON due.tenant_id = t.id
+                LEFT JOIN paid ON paid.tenant_id = t.id
+                WHERE t.id > :low AND t.id <= :high
+            )
+        ''', {**params, 'low': low, 'high': low + MONTH_CLOSE_BATCH})
+        conn.commit()
+        tenants_closed += cursor.rowcount
+    return f"{tenants_closed} tenant balances closed for {month_year}"
+
+
+def close_months(conn, months):
+    # Months must be in order: each close brings forward the previous one's
+    # closing balances
+    return "\n".join(month_close(conn, month_year) for month_year in months)
+
+
+# Closed months whose snapshot no longer matches the payments or leases behind
+# it: a payment recorded late, a lease corrected after the close, or a tenant
+# with a lease or payment in the month but no snapshot row. Snapshots of
+# deleted tenants are left alone.
+_STALE_MONTH_QUERY = tenant_month_sql('''
+months AS (
+    SELECT DISTINCT month_year, month_start, date(month_start, '+1 month') AS month_end
+    FROM balance_snapshots
+)''') + '''
+, expected AS (
+    SELECT tenant_id, month_year, month_start FROM paid
+    UNION
+    SELECT tenant_id, month_year, month_start FROM due
+)
+SELECT MIN(month_start) FROM (
+    SELECT b.month_start
+    FROM balance_snapshots b
+    JOIN tenants t ON t.id = b.tenant_id
+    LEFT JOIN paid ON paid.tenant_id = b.tenant_id AND paid.month_year = b.month_year
+    LEFT JOIN due ON due.tenant_id = b.tenant_id AND due.month_year = b.month_year
+    WHERE ABS(b.paid - COALESCE(paid.total_paid, 0)) > 0.005
+       OR ABS(b.rent_due - COALESCE(due.rent_due, 0)) > 0.005
+    UNION ALL
+    SELECT e.month_start
+    FROM expected e
+    JOIN tenants t ON t.id = e.tenant_id
+    WHERE NOT EXISTS (SELECT 1 FROM balance_snapshots b
+                      WHERE b.tenant_id = e.tenant_id AND b.month_year = e.month_year)
+)
+'''
+
+
+def first_stale_month(conn):
+    # month_start of the earliest closed month that needs closing again, or None
+    return conn.execute(_STALE_MONTH_QUERY).fetchone()[0]
+
+
+def _months_between(first_start, last_start):
+    if first_start > last_start:
+        return []
+    return list(pd.period_range(first_start, last_start, freq='M').strftime("%b %Y"))
+
+
+def months_to_close(conn, from_start=None):
+    # Month labels to close, oldest first. By default that is every month
+    # after the last closed one (or since the first lease) up to last month;
+    # from_start re-closes from that month, through every later closed month.
+    last_closed = conn.execute("SELECT MAX(month_start) FROM balance_snapshots").fetchone()[0]
+    through = max(month_start(previous_month()), last_closed or '', from_start or '')
+    if from_start is None:
+        if last_closed:
+            from_start = (pd.Timestamp(last_closed) + pd.DateOffset(months=1)).strftime("%Y-%m-%d")
+        else:
+            first_lease = conn.execute("SELECT MIN(move_in) FROM leases").fetchone()[0]
+            if first_lease is None:
+                return []
+            from_start = first_lease[:7] + '-01'
+    return _months_between(from_start, through)
+
+
+def warm_reports(conn, months=None):
+    # Recompute any Dashboard / Monthly Report result whose cached copy is
+    # stale, for the portfolio and for each property
+    months = months or [datetime.now().strftime("%b %Y"), previous_month()]
+    property_ids = [None] + [r[0] for r in conn.execute("SELECT id FROM properties ORDER BY id")]
+    for month_year in months:
+        cached_report(conn, 'dashboard', month_year)
+        for property_id in property_ids:
+            cached_report(conn, 'monthly_report', month_year, property_id)
+    return f"Warmed {len(months)} months x {len(property_ids)} property views"
+
+
+def run_job(conn, job, run_key, func, *args):
+    run_id = _record_start(conn, job, run_key)
+    try:
+        detail = func(conn, *args)
+    except Exception:
+        conn.rollback()
+        _record_finish(conn, run_id, 'failed', traceback.format_exc(limit=3))
+        ok = False
+    else:
+        _record_finish(conn, run_id, 'success', detail)
+        ok = True
+    if job in RUNS_KEPT:
+        prune_job_runs(conn, job, RUNS_KEPT[job])
+    return ok
+
+
+def _run_month_close(conn, months):
+    run_key = months[0] if len(months) == 1 else f"{months[0]} – {months[-1]}"
+    return run_job(conn, 'month_close', run_key, close_months, months)
+
+
+def run_pending(conn, state=None):
+    # Runs whatever is due now. state carries the last warm-up time and the
+    # data_version last checked for stale month-ends; pass the returned dict
+    # back on the next tick.
+    state = state or {'last_warm': None, 'checked_version': None}
+    version = get_data_version(conn)
+
+    months = []
+    # Closed months can only go stale through a write, so the (full) check
+    # runs once per data_version rather than on every tick
+    if version != state['checked_version']:
+        stale = first_stale_month(conn)
+        if stale:
+            months = months_to_close(conn, stale)
+    months = months or months_to_close(conn)
+
+    closed_ok = True
+    if months:
+        closed_ok = _run_month_close(conn, months)
+        if closed_ok:
+            # Balances changed, so reports are rebuilt on this tick
+            state['last_warm'] = None
+    if closed_ok:
+        state['checked_version'] = version
+
+    if state['last_warm'] is None or time.time() - state['last_warm'] >= WARM_INTERVAL_SECONDS:
+        run_job(conn, 'warm_reports', datetime.now().strftime("%b %Y"), warm_reports)
+        state['last_warm'] = time.time()
+    return state
+
+
+def run_scheduler(db_path=DB_PATH, poll_seconds=POLL_SECONDS, stop_event=None):
+    stop_event = stop_event or threading.Event()
+    conn = connect(db_path)
+    try:
+        ensure_leases_schema(conn)
+        ensure_reports_schema(conn)
+        ensure_scheduler_schema(conn)
+        # State starts empty, so caches are rebuilt and closed months checked
+        # straight after a restart
+        state = None
+        while not stop_event.is_set():
+            try:
+                state = run_pending(conn, state)
+            except sqlite3.Error as e:
+                print(f"Scheduler tick failed: {e}")
+            stop_event.wait(poll_seconds)
+    finally:
+        conn.close()
+
+
+def start_scheduler_thread(db_path=DB_PATH, poll_seconds=POLL_SECONDS):
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_scheduler,
+        args=(db_path, poll_seconds, stop_event),
+        name="tenant-scheduler",
+        daemon=True
+    )
+    thread.start()
+    return thread, stop_event
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recurring TenantTracker jobs")
+    parser.add_argument("--db", default=DB_PATH, help="Database file (default: tenants.db)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="Run the scheduler loop until stopped (sidecar mode)")
+    run_p.add_argument("--poll-seconds", type=int, default=POLL_SECONDS)
+
+    close_p = sub.add_parser("close-month",
+                             help="Snapshot tenant balances for a month and re-close the closed months after it")
+    close_p.add_argument("--month", default=None,
+                         help="Month/Year, e.g. 'Feb 2026' (default: every month not closed yet)")
+
+    warm_p = sub.add_parser("warm", help="Precompute Dashboard and Monthly Report results")
+    warm_p.add_argument("--month", action="append", help="Month/Year to warm; repeatable")
+
+    history_p = sub.add_parser("history", help="Show recent job runs")
+    history_p.add_argument("--limit", type=int, default=20)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        try:
+            run_scheduler(args.db, args.poll_seconds)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    conn = connect(args.db)
+    try:
+        ensure_leases_schema(conn)
+        ensure_reports_schema(conn)
+        ensure_scheduler_schema(conn)
+        if args.command == "close-month":
+            months = months_to_close(conn, month_start(args.month) if args.month else None)
+            if not months:
+                print("Nothing to close")
+                return
+            ok = _run_month_close(conn, months)
+            print(get_job_history(conn, 1).iloc[0]['detail'])
+            raise SystemExit(0 if ok else 1)
+        elif args.command == "warm":
+            ok = run_job(conn, 'warm_reports', datetime.now().strftime("%b %Y"), warm_reports, args.month)
+            print(get_job_history(conn, 1).iloc[0]['detail'])
+            raise SystemExit(0 if ok else 1)
+        elif args.command == "history":
+            print(get_job_history(conn, args.limit).to_string(index=False))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
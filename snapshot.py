@@ -0,0 +1,104 @@
+import sqlite3
+import os
+import threading
+import time
+
+DB_PATH = 'tenants.db'
+
+# TENANT_READ_MODE selects where analytical pages read from:
+#   snapshot - a process-wide in-memory copy taken with the backup API (default)
+#   readonly - a separate mode=ro connection to the live file
+#   live     - the shared write connection, as before
+READ_MODES = ('snapshot', 'readonly', 'live')
+DEFAULT_REFRESH_SECONDS = 300
+
+
+def read_mode():
+    mode = os.environ.get("TENANT_READ_MODE", "snapshot").lower()
+    return mode if mode in READ_MODES else "snapshot"
+
+
+def refresh_interval():
+    return float(os.environ.get("TENANT_SNAPSHOT_REFRESH_SECONDS", DEFAULT_REFRESH_SECONDS))
+
+
+class Snapshot:
+    # Holds the current in-memory copy. A refresh builds a new database and
+    # swaps it in, so readers already holding the previous connection finish
+    # their queries undisturbed.
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+        self.taken_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        src = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=30)
+        mem = sqlite3.connect(":memory:", check_same_thread=False)
+        try:
+            # Copy in page steps so the app's writers are never blocked for long
+            src.backup(mem, pages=256, sleep=0.005)
+        finally:
+            src.close()
+        mem.execute("PRAGMA query_only = ON")
+        self.conn, self.taken_at = mem, time.time()
+
+    def get(self, max_age):
+        if self.conn is None:
+            with self._lock:
+                if self.conn is None:
+                    self.refresh()
+        elif time.time() - self.taken_at >= max_age and self._lock.acquire(blocking=False):
+            # Only one session refreshes; the rest keep using the old copy meanwhile
+            try:
+                self.refresh()
+            finally:
+                self._lock.release()
+        return self.conn, self.taken_at
+
+
+_snapshots = {}
+_readonly_conns = {}
+_snapshots_lock = threading.Lock()
+
+
+def _get_snapshot(db_path):
+    with _snapshots_lock:
+        if db_path not in _snapshots:
+            _snapshots[db_path] = Snapshot(db_path)
+        return _snapshots[db_path]
+
+
+def get_read_connection(write_conn, db_path=DB_PATH, mode=None, max_age=None):
+    # Returns (connection, taken_at). taken_at is None when the connection
+    # reads live data rather than a snapshot.
+    mode = mode or read_mode()
+    if mode == "live":
+        return write_conn, None
+    if mode == "readonly":
+        with _snapshots_lock:
+            if db_path not in _readonly_conns:
+                _readonly_conns[db_path] = sqlite3.connect(
+                    f"file:{db_path}?mode=ro", uri=True, timeout=30, check_same_thread=False)
+            return _readonly_conns[db_path], None
+    max_age = refresh_interval() if max_age is None else max_age
+    return _get_snapshot(db_path).get(max_age)
+
+
+def force_refresh(db_path=DB_PATH):
+    snapshot = _get_snapshot(db_path)
+    with snapshot._lock:
+        snapshot.refresh()
+    return snapshot.taken_at
+
+
+def describe_age(taken_at):
+    if taken_at is None:
+        return "live data"
+    age = int(time.time() - taken_at)
+    if age < 60:
+        return f"snapshot {age}s old"
+    if age < 3600:
+        return f"snapshot {age // 60} min old"
+    return f"snapshot {age // 3600}h {age % 3600 // 60} min old"
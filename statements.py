@@ -0,0 +1,325 @@
+import sqlite3
+import os
+import re
+import io
+import html
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import tempfile
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from reports import month_bounds, month_params, tenant_month_sql
+
+DB_PATH = 'tenants.db'
+RECENT_NOTES = 3
+# Statements per task sent to a worker. Large enough that pickling overhead
+# is small next to rendering, small enough to keep every core busy.
+CHUNK_SIZE = 200
+
+
+# ────────────────────────────────────────────────
+# DATA (parent process, set-based queries)
+# ────────────────────────────────────────────────
+def fetch_statement_data(conn, month_year, property_id=None):
+    # Three queries for the whole period regardless of tenant count: tenant
+    # headers with rent due and balance brought forward, the period's
+    # payments, and each tenant's latest notes
+    params = month_params(month_year, property_id=int(property_id) if property_id is not None else None)
+
+    tenants = conn.execute(tenant_month_sql() + '''
+        , last_close AS (
+            SELECT tenant_id, closing_balance,
+                   ROW_NUMBER() OVER (PARTITION BY tenant_id ORDER BY month_start DESC) AS rn
+            FROM balance_snapshots
+            WHERE month_start < :start
+        )
+        SELECT t.id, t.name, COALESCE(due.unit, t.unit) AS unit, t.email, t.phone,
+               pr.name AS property_name, pr.address,
+               COALESCE(due.rent_due, 0) AS rent_due,
+               COALESCE(last_close.closing_balance, 0) AS brought_forward,
+               COALESCE(paid.total_paid, 0) AS total_paid
+        FROM tenants t
+        LEFT JOIN properties pr ON pr.id = t.property_id
+        LEFT JOIN due ON due.tenant_id = t.id
+        LEFT JOIN last_close ON last_close.tenant_id = t.id AND last_close.rn = 1
+        LEFT JOIN paid ON paid.tenant_id = t.id
+        WHERE (:property_id IS NULL OR t.property_id = :property_id)
+          AND (due.rent_due IS NOT NULL OR paid.total_paid IS NOT NULL
+               OR COALESCE(last_close.closing_balance, 0) != 0)
+        ORDER BY pr.name, t.name
+    ''', params).fetchall()
+
+    payments = {}
+    for tenant_id, payment_date, method, amount in conn.execute('''
+        SELECT tenant_id, payment_date, method, amount
+        FROM payments
+        WHERE month_year = :month_year
+        ORDER BY tenant_id, payment_date
+    ''', params):
+        payments.setdefault(tenant_id, []).append(
+            {'date': payment_date, 'method': method, 'amount': amount or 0})
+
+    notes = {}
+    for tenant_id, note_date, note_type, note_text in conn.execute('''
+        SELECT tenant_id, note_date, note_type, note_text
+        FROM (
+            SELECT tenant_id, note_date, note_type, note_text,
+                   ROW_NUMBER() OVER (PARTITION BY tenant_id ORDER BY note_date DESC) AS rn
+            FROM notes
+            WHERE note_date < :end
+        )
+        WHERE rn <= :recent
+        ORDER BY tenant_id, note_date DESC
+    ''', {**params, 'recent': RECENT_NOTES}):
+        notes.setdefault(tenant_id, []).append({'date': note_date, 'type': note_type, 'text': note_text})
+
+    statements = []
+    for tid, name, unit, email, phone, property_name, address, rent_due, brought_forward, total_paid in tenants:
+        statements.append({
+            'tenant_id': tid,
+            'name': name,
+            'unit': unit,
+            'email': email,
+            'phone': phone,
+            'property_name': property_name,
+            'address': address,
+            'month_year': month_year,
+            'rent_due': rent_due,
+            'brought_forward': brought_forward,
+            'total_paid': total_paid,
+            'balance': brought_forward + rent_due - total_paid,
+            'payments': payments.get(tid, []),
+            'notes': notes.get(tid, [])
+        })
+    return statements
+
+
+# ────────────────────────────────────────────────
+# RENDERING (worker processes)
+# ────────────────────────────────────────────────
+_STYLE = '''
+body { font-family: Helvetica, Arial, sans-serif; font-size: 12px; color: #222; margin: 32px; }
+h1 { font-size: 20px; margin-bottom: 0; }
+h2 { font-size: 14px; margin-top: 24px; border-bottom: 1px solid #ccc; }
+table { border-collapse: collapse; width: 100%; }
+th, td { text-align: left; padding: 4px 6px; border-bottom: 1px solid #eee; }
+td.amount, th.amount { text-align: right; }
+.balance { font-weight: bold; font-size: 14px; }
+.overdue { color: #b00020; }
+.muted { color: #777; }
+'''
+
+
+def _money(value):
+    return f"R{value:,.2f}"
+
+
+def render_html(s):
+    e = html.escape
+    payment_rows = "".join(
+        f"<tr><td>{e(p['date'] or '')}</td><td>{e(p['method'] or '')}</td>"
+        f"<td class='amount'>{_money(p['amount'])}</td></tr>"
+        for p in s['payments']
+    ) or "<tr><td colspan='3' class='muted'>No payments received for this period</td></tr>"
+    note_rows = "".join(
+        f"<tr><td>{e(n['date'] or '')}</td><td>{e(n['type'] or '')}</td><td>{e(n['text'] or '')}</td></tr>"
+        for n in s['notes']
+    )
+    notes_section = (f"<h2>Recent Notes</h2><table><tr><th>Date</th><th>Type</th><th>Note</th></tr>{note_rows}</table>"
+                     if note_rows else "")
+    balance_class = "balance overdue" if s['balance'] > 0 else "balance"
+    location = ", ".join(e(part) for part in [f"Unit {s['unit'].strip()}" if (s['unit'] or '').strip() else '',
+                                                s['property_name']] if part)
+    return f'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Statement {e(s['month_year'])} – {e(s['name'])}</title>
+<style>{_STYLE}</style></head>
+<body>
+<h1>ALOTA PROPERTIES</h1>
+<p class="muted">Tenant statement for {e(s['month_year'])}</p>
+<p><strong>{e(s['name'])}</strong><br>
+{location}<br>
+{e(s['address'] or '')}</p>
+<h2>Summary</h2>
+<table>
+<tr><td>Balance brought forward</td><td class="amount">{_money(s['brought_forward'])}</td></tr>
+<tr><td>Rent due</td><td class="amount">{_money(s['rent_due'])}</td></tr>
+<tr><td>Payments received</td><td class="amount">-{_money(s['total_paid'])}</td></tr>
+<tr><td class="{balance_class}">Balance carried forward</td><td class="amount {balance_class}">{_money(s['balance'])}</td></tr>
+</table>
+<h2>Payments Received</h2>
+<table><tr><th>Date</th><th>Method</th><th class="amount">Amount</th></tr>{payment_rows}</table>
+{notes_section}
+</body></html>
+'''
+
+
+def statement_filename(s, fmt):
+    parts = [s['property_name'] or 'no_property', s['unit'] or '', s['name'], str(s['tenant_id'])]
+    slug = "_".join(re.sub(r'[^A-Za-z0-9]+', '-', p).strip('-') for p in parts if p)
+    return f"{s['month_year'].replace(' ', '_')}/{slug}.{fmt}"
+
+
+def render_chunk(chunk, fmt='html'):
+    if fmt == 'pdf':
+        # weasyprint is optional and only needed for PDF output
+        from weasyprint import HTML
+    rendered = []
+    for s in chunk:
+        doc = render_html(s)
+        data = HTML(string=doc).write_pdf() if fmt == 'pdf' else doc.encode('utf-8')
+        rendered.append((statement_filename(s, fmt), data))
+    return rendered
+
+
+# ────────────────────────────────────────────────
+# BATCH GENERATION
+# ────────────────────────────────────────────────
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def render_all(statements, fmt='html', workers=None):
+    # Yields (filename, bytes) as chunks finish. "spawn" keeps workers clean
+    # when the parent is the Streamlit server with background threads running.
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(statements) <= CHUNK_SIZE:
+        yield from render_chunk(statements, fmt)
+        return
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        for rendered in pool.map(functools.partial(render_chunk, fmt=fmt), _chunks(statements, CHUNK_SIZE)):
+            yield from rendered
+
+
+def generate_statements(conn, month_year, output, property_id=None, fmt='html', workers=None):
+    # output ending in .zip (or a file-like object) is written as a zip
+    # archive, anything else is treated as a directory
+    statements = fetch_statement_data(conn, month_year, property_id)
+    count = 0
+    if hasattr(output, 'write') or str(output).endswith('.zip'):
+        with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, data in render_all(statements, fmt, workers):
+                archive.writestr(name, data)
+                count += 1
+    else:
+        for name, data in render_all(statements, fmt, workers):
+            path = os.path.join(output, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+            count += 1
+    return count
+
+
+def statements_zip_bytes(conn, month_year, property_id=None, fmt='html', workers=None):
+    buffer = io.BytesIO()
+    count = generate_statements(conn, month_year, buffer, property_id, fmt, workers)
+    return buffer.getvalue(), count
+
+
+# ────────────────────────────────────────────────
+# BENCHMARK
+# ────────────────────────────────────────────────
+def _build_bench_db(path, n_tenants, month_year):
+    from leases import ensure_leases_schema
+    from reports import ensure_reports_schema
+
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE properties (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+            total_units INTEGER NOT NULL DEFAULT 1, location TEXT, address TEXT);
+        CREATE TABLE tenants (id INTEGER PRIMARY KEY AUTOINCREMENT, property_id INTEGER, name TEXT NOT NULL,
+            unit TEXT, rent REAL NOT NULL, email TEXT, phone TEXT);
+        CREATE TABLE payments (id INTEGER PRIMARY KEY AUTOINCREMENT, tenant_id INTEGER, property_id INTEGER,
+            payment_date TEXT, month_year TEXT, amount REAL, method TEXT);
+        CREATE TABLE notes (id INTEGER PRIMARY KEY AUTOINCREMENT, tenant_id INTEGER, property_id INTEGER,
+            note_date TEXT, note_type TEXT, note_text TEXT);
+        CREATE TABLE expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, property_id INTEGER, month_year TEXT,
+            garden REAL DEFAULT 0, electrical REAL DEFAULT 0, other_maintenance REAL DEFAULT 0);
+    ''')
+    rng = random.Random(42)
+    n_props = max(1, n_tenants // 100)
+    conn.executemany("INSERT INTO properties (name, total_units, address) VALUES (?, ?, ?)",
+                     [(f"Property {i}", 120, f"{i} Bench Street") for i in range(n_props)])
+    conn.executemany("INSERT INTO tenants (property_id, name, unit, rent) VALUES (?, ?, ?, ?)",
+                     [(i % n_props + 1, f"Tenant {i}", f"U{i % 120}", rng.choice([2500, 3500, 5000]))
+                      for i in range(n_tenants)])
+    start, _ = month_bounds(month_year)
+    conn.executemany('''INSERT INTO payments (tenant_id, property_id, payment_date, month_year, amount, method)
+                        VALUES (?, ?, ?, ?, ?, ?)''',
+                     [(i + 1, i % n_props + 1, start[:8] + f"{rng.randint(1, 28):02d}", month_year,
+                       rng.choice([1000, 2500, 3500]), rng.choice(["EFT", "Cash", "SnapScan"]))
+                      for i in range(n_tenants) for _ in range(rng.randint(0, 2))])
+    conn.executemany('''INSERT INTO notes (tenant_id, property_id, note_date, note_type, note_text)
+                        VALUES (?, ?, ?, ?, ?)''',
+                     [(rng.randint(1, n_tenants), 1, start + " 09:00:00", "Payment Excuse",
+                       "Will pay the balance next week")
+                      for _ in range(n_tenants // 2)])
+    conn.commit()
+    ensure_leases_schema(conn)
+    conn.execute("UPDATE leases SET move_in = ?", ("2000-01-01",))
+    ensure_reports_schema(conn)
+    conn.commit()
+    return conn
+
+
+def benchmark(n_tenants=5000, month_year="Jan 2026", fmt='html', workers=None):
+    tmp_dir = tempfile.mkdtemp(prefix="statements_bench_")
+    try:
+        conn = _build_bench_db(os.path.join(tmp_dir, "bench.db"), n_tenants, month_year)
+        started = time.perf_counter()
+        statements = fetch_statement_data(conn, month_year)
+        fetched = time.perf_counter()
+        count = generate_statements(conn, month_year, os.path.join(tmp_dir, "statements.zip"), fmt=fmt, workers=workers)
+        finished = time.perf_counter()
+        conn.close()
+        return {'statements': count, 'fetch_seconds': fetched - started,
+                'total_seconds': finished - started,
+                'per_second': count / (finished - started) if finished > started else float('inf'),
+                'tenants_fetched': len(statements)}
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate tenant statements for a period")
+    parser.add_argument("--db", default=DB_PATH, help="Database file (default: tenants.db)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen_p = sub.add_parser("generate", help="Write statements to a .zip file or a directory")
+    gen_p.add_argument("month", help="Month/Year, e.g. 'Feb 2026'")
+    gen_p.add_argument("output", help="Output .zip path or directory")
+    gen_p.add_argument("--property-id", type=int, default=None)
+    gen_p.add_argument("--format", choices=["html", "pdf"], default="html")
+    gen_p.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+
+    bench_p = sub.add_parser("bench", help="Time generation against a synthetic database")
+    bench_p.add_argument("--tenants", type=int, default=5000)
+    bench_p.add_argument("--format", choices=["html", "pdf"], default="html")
+    bench_p.add_argument("--workers", type=int, default=None)
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        conn = sqlite3.connect(args.db, timeout=30)
+        try:
+            started = time.perf_counter()
+            count = generate_statements(conn, args.month, args.output, args.property_id, args.format, args.workers)
+            print(f"Wrote {count} statements to {args.output} in {time.perf_counter() - started:.1f}s")
+        finally:
+            conn.close()
+    elif args.command == "bench":
+        result = benchmark(args.tenants, fmt=args.format, workers=args.workers)
+        print(f"{result['statements']} statements in {result['total_seconds']:.2f}s "
+              f"(fetch {result['fetch_seconds']:.2f}s, {result['per_second']:,.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
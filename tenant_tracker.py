@@ -5,6 +5,17 @@ import streamlit as st
 import io
 import re
 import altair as alt
+import os
+from backup import create_backup, list_backups, start_backup_thread
+from chart_data import GROUP_OPTIONS, MAX_GROUPS, TOP_N_GROUPS, collection_chart_data
+from leases import ensure_leases_schema, start_lease, change_lease_terms, end_lease, get_current_lease, monthly_occupancy
+from reports import ensure_reports_schema, cached_report
+from reference_data import get_reference_data
+from cdc import ensure_cdc_schema
+from statements import statements_zip_bytes
+from forecast import forecast_cash_flow, MIN_HORIZON, MAX_HORIZON
+from snapshot import get_read_connection, force_refresh, describe_age
+from scheduler import ensure_scheduler_schema, start_scheduler_thread, get_job_history
 
 # Connect to database
 conn = sqlite3.connect('tenants.db')
@@ -114,6 +125,16 @@ if 'property_id' not in columns:
 
 conn.commit()
 
+# Lease periods (move-in/move-out) for historical occupancy
+ensure_leases_schema(conn)
+
+# Report cache, month-close balance snapshots and job history
+ensure_reports_schema(conn)
+ensure_scheduler_schema(conn)
+
+# Change events for incremental sync to downstream systems
+ensure_cdc_schema(conn)
+
 # Pre-load your 7 properties if none exist
 cursor.execute("SELECT COUNT(*) FROM properties")
 if cursor.fetchone()[0] == 0:
@@ -129,6 +150,25 @@ if cursor.fetchone()[0] == 0:
     cursor.executemany("INSERT INTO properties (name, total_units, location, address) VALUES (?, ?, ?, ?)", properties_data)
     conn.commit()
 
+# Optional in-process scheduled backups (set TENANT_BACKUP_INTERVAL_HOURS to enable).
+# st.cache_resource keeps a single backup thread per server process across reruns.
+@st.cache_resource
+def start_scheduled_backups(interval_hours):
+    return start_backup_thread(interval_hours=interval_hours, keep=int(os.environ.get("TENANT_BACKUP_KEEP", 14)))
+
+backup_interval = os.environ.get("TENANT_BACKUP_INTERVAL_HOURS")
+if backup_interval:
+    start_scheduled_backups(float(backup_interval))
+
+# Month-close and cache warm-up jobs run in-process unless a sidecar
+# (`python scheduler.py run`) is used instead; set TENANT_SCHEDULER=off then.
+@st.cache_resource
+def start_background_jobs():
+    return start_scheduler_thread()
+
+if os.environ.get("TENANT_SCHEDULER", "on").lower() not in ("off", "0", "false"):
+    start_background_jobs()
+
 # Streamlit configuration
 st.set_page_config(page_title="ALOTA PROPERTIES", layout="wide", initial_sidebar_state="expanded")
 st.title("ALOTA PROPERTIES")
@@ -136,18 +176,38 @@ st.title("ALOTA PROPERTIES")
 # Sidebar navigation
 page = st.sidebar.selectbox(
     "Menu",
-    ["Dashboard", "Properties", "Add/Edit Tenants", "Record Payment", "Manage Expenses", "Expense Trend Dashboard", "Monthly Report", "Payment History", "Notes Overview", "Search"]
+    ["Dashboard", "Properties", "Add/Edit Tenants", "Record Payment", "Manage Expenses", "Expense Trend Dashboard", "Cash Flow Forecast", "Monthly Report", "Payment History", "Notes Overview", "Search"]
 )
 
+# Shared property/tenant lookups, rebuilt only after writes
+refs = get_reference_data(conn)
+
 # Sidebar property selector
-props_df = pd.read_sql_query("SELECT id, name FROM properties ORDER BY name", conn)
-property_options = ["All Properties"] + props_df['name'].tolist()
+property_options = ["All Properties"] + [refs.property_name(pid) for pid in refs.property_ids]
 selected_property_name = st.sidebar.selectbox("Select Property", property_options)
 
 if selected_property_name == "All Properties":
     selected_property_id = None
 else:
-    selected_property_id = props_df[props_df['name'] == selected_property_name]['id'].iloc[0]
+    selected_property_id = refs.property_ids_by_name[selected_property_name]
+
+# Sidebar backups
+with st.sidebar.expander("Backups"):
+    if st.button("Backup Now"):
+        snapshot = create_backup(keep=int(os.environ.get("TENANT_BACKUP_KEEP", 14)))
+        st.success(f"Saved {os.path.basename(snapshot)}")
+    snapshots = list_backups()
+    if snapshots:
+        st.caption(f"Latest: {os.path.basename(snapshots[0])} ({len(snapshots)} kept)")
+    else:
+        st.caption("No backups yet")
+
+with st.sidebar.expander("Background Jobs"):
+    job_history = get_job_history(conn, 5)
+    if job_history.empty:
+        st.caption("No job runs yet")
+    else:
+        st.dataframe(job_history[['job', 'run_key', 'finished_at', 'status']], hide_index=True)
 
 # Helper functions
 def get_tenants(property_id=None):
@@ -155,7 +215,8 @@ def get_tenants(property_id=None):
         return pd.read_sql_query("SELECT * FROM tenants WHERE property_id = ? ORDER BY name", conn, params=(property_id,))
     return pd.read_sql_query("SELECT * FROM tenants ORDER BY name", conn)
 
-def get_payments(property_id=None):
+def get_payments(property_id=None, *, db=None):
+    db = db or conn
     if property_id:
         return pd.read_sql_query('''
             SELECT p.*, t.name, t.unit 
@@ -163,15 +224,28 @@ def get_payments(property_id=None):
             JOIN tenants t ON p.tenant_id = t.id 
             WHERE p.property_id = ?
             ORDER BY p.payment_date DESC
-        ''', conn, params=(property_id,))
+        ''', db, params=(property_id,))
     return pd.read_sql_query('''
         SELECT p.*, t.name, t.unit 
         FROM payments p 
         JOIN tenants t ON p.tenant_id = t.id 
         ORDER BY p.payment_date DESC
-    ''', conn)
+    ''', db)
 
-def get_notes(property_id=None):
+def get_notes(property_id=None, *, tenant_id=None, note_type=None, db=None):
+    db = db or conn
+    if tenant_id:
+        query = '''
+            SELECT n.*, t.name, t.unit 
+            FROM notes n 
+            JOIN tenants t ON n.tenant_id = t.id 
+            WHERE n.tenant_id = ?
+        '''
+        params = [tenant_id]
+        if note_type and note_type != "All":
+            query += " AND n.note_type = ?"
+            params.append(note_type)
+        return pd.read_sql_query(query + " ORDER BY n.note_date DESC", db, params=params)
     if property_id:
         return pd.read_sql_query('''
             SELECT n.*, t.name, t.unit 
@@ -179,35 +253,49 @@ def get_notes(property_id=None):
             JOIN tenants t ON n.tenant_id = t.id 
             WHERE n.property_id = ?
             ORDER BY n.note_date DESC
-        ''', conn, params=(property_id,))
+        ''', db, params=(property_id,))
     return pd.read_sql_query('''
         SELECT n.*, t.name, t.unit 
         FROM notes n 
         JOIN tenants t ON n.tenant_id = t.id 
         ORDER BY n.note_date DESC
-    ''', conn)
+    ''', db)
 
-def get_photos_for_note(note_id):
+def get_photos_for_note(note_id, *, db=None):
+    db = db or conn
     return pd.read_sql_query('''
         SELECT id, filename, upload_date 
         FROM maintenance_photos 
         WHERE note_id = ?
         ORDER BY upload_date
-    ''', conn, params=(note_id,))
+    ''', db, params=(note_id,))
 
-def get_expenses(property_id=None, month_year=None):
+def get_expenses(property_id=None, month_year=None, *, db=None):
+    db = db or conn
     if property_id and month_year:
         return pd.read_sql_query('''
             SELECT * FROM expenses 
             WHERE property_id = ? AND month_year = ?
-        ''', conn, params=(property_id, month_year))
+        ''', db, params=(property_id, month_year))
     elif property_id:
         return pd.read_sql_query('''
             SELECT * FROM expenses 
             WHERE property_id = ?
             ORDER BY month_year DESC
-        ''', conn, params=(property_id,))
-    return pd.read_sql_query("SELECT * FROM expenses ORDER BY month_year DESC", conn)
+        ''', db, params=(property_id,))
+    return pd.read_sql_query("SELECT * FROM expenses ORDER BY month_year DESC", db)
+
+# Analytical pages read from a snapshot so heavy reports never contend
+# with clerks writing through `conn` (see snapshot.py for the modes)
+ANALYTICAL_PAGES = ["Dashboard", "Expense Trend Dashboard", "Cash Flow Forecast", "Monthly Report", "Notes Overview"]
+if page in ANALYTICAL_PAGES:
+    read_conn, snapshot_taken_at = get_read_connection(conn)
+    st.sidebar.caption(f"Reports use {describe_age(snapshot_taken_at)}")
+    if snapshot_taken_at is not None and st.sidebar.button("Refresh Snapshot"):
+        force_refresh()
+        st.rerun()
+else:
+    read_conn = conn
 
 # ────────────────────────────────────────────────
 # DASHBOARD
@@ -215,36 +303,25 @@ def get_expenses(property_id=None, month_year=None):
 if page == "Dashboard":
     st.header("ALOTA PROPERTIES - Dashboard")
     
-    properties = pd.read_sql_query("SELECT * FROM properties", conn)
+    current_month = datetime.now().strftime("%b %Y")
+    # Precomputed by the warm-up job; recomputed here only if data changed since
+    summary = cached_report(read_conn, 'dashboard', current_month, store=read_conn is conn)
     
-    total_potential = 0
-    total_actual = 0
-    total_expenses = 0
+    total_potential = summary['potential'].sum()
+    total_actual = summary['actual'].sum()
+    total_expenses = summary['expenses'].sum()
     
-    for _, prop in properties.iterrows():
-        tenants_in_prop = get_tenants(prop['id'])
-        occupied = len(tenants_in_prop)
-        occupancy = (occupied / prop['total_units'] * 100) if prop['total_units'] > 0 else 0
-        
-        potential = tenants_in_prop['rent'].sum() if not tenants_in_prop.empty else 0
-        total_potential += potential
-        
-        current_month = datetime.now().strftime("%b %Y")
-        payments_this_month = get_payments(prop['id'])
-        payments_this_month = payments_this_month[payments_this_month['month_year'] == current_month]
-        actual = payments_this_month['amount'].sum()
-        total_actual += actual
-        
-        expenses = get_expenses(prop['id'], current_month)
-        exp_total = expenses[['garden', 'electrical', 'other_maintenance']].sum().sum() if not expenses.empty else 0
-        total_expenses += exp_total
-        
-        net = actual - exp_total
+    for prop in summary.itertuples():
+        occupied = prop.occupied
+        occupancy = prop.occupancy
+        potential = prop.potential
+        actual = prop.actual
+        net = prop.net
         
-        st.subheader(f"{prop['name']}")
+        st.subheader(f"{prop.name}")
         col1, col2, col3, col4, col5 = st.columns(5)
-        col1.metric("Total Units", prop['total_units'])
-        col2.metric("Occupied", f"{occupied}/{prop['total_units']}", f"{occupancy:.1f}%")
+        col1.metric("Total Units", prop.total_units)
+        col2.metric("Occupied", f"{occupied}/{prop.total_units}", f"{occupancy:.1f}%")
         col3.metric("Potential Revenue", f"R{potential:,.0f}")
         col4.metric("Actual Revenue", f"R{actual:,.0f}")
         col5.metric("Net This Month", f"R{net:,.0f}", delta_color="inverse" if net < 0 else "normal")
@@ -259,17 +336,34 @@ if page == "Dashboard":
     col3.metric("Total Expenses", f"R{total_expenses:,.0f}")
     col4.metric("Overall Net", f"R{grand_net:,.0f}", delta_color="inverse" if grand_net < 0 else "normal")
 
+    st.subheader("Occupancy History")
+    history_months = st.slider("Months of history", min_value=3, max_value=60, value=12)
+    end_month = datetime.now().replace(day=1)
+    start_month = (pd.Timestamp(end_month) - pd.DateOffset(months=history_months - 1)).to_pydatetime()
+    history = monthly_occupancy(read_conn, start_month.strftime("%b %Y"), end_month.strftime("%b %Y"))
+    if selected_property_id:
+        history = history[history['property_id'] == selected_property_id]
+    if not history.empty:
+        occupancy_chart = alt.Chart(history).mark_line(point=True).encode(
+            x=alt.X('month:T', title='Month'),
+            y=alt.Y('occupancy:Q', title='Occupancy (%)'),
+            color=alt.Color('name:N', legend=alt.Legend(title="Property")),
+            tooltip=['name', 'month_year', 'occupied', 'total_units',
+                     alt.Tooltip('occupancy:Q', format='.1f'),
+                     alt.Tooltip('rent_roll:Q', title='Rent Roll (R)', format=',.0f')]
+        ).properties(width='container', height=350)
+        st.altair_chart(occupancy_chart, use_container_width=True)
+
 # ────────────────────────────────────────────────
 # MANAGE EXPENSES
 # ────────────────────────────────────────────────
 elif page == "Manage Expenses":
     st.header("Manage Monthly Expenses")
     
-    prop_list = pd.read_sql_query("SELECT id, name FROM properties ORDER BY name", conn)
     selected_prop = st.selectbox(
         "Property",
-        options=prop_list['id'].tolist(),
-        format_func=lambda x: prop_list[prop_list['id']==x]['name'].iloc[0]
+        options=refs.property_ids,
+        format_func=refs.property_name
     )
     
     current_month = datetime.now().strftime("%b %Y")
@@ -312,14 +406,13 @@ elif page == "Manage Expenses":
 elif page == "Expense Trend Dashboard":
     st.header("Expense Trend Dashboard")
     
-    prop_list = pd.read_sql_query("SELECT id, name FROM properties ORDER BY name", conn)
     selected_prop = st.selectbox(
         "Select Property",
-        options=prop_list['id'].tolist(),
-        format_func=lambda x: prop_list[prop_list['id']==x]['name'].iloc[0]
+        options=refs.property_ids,
+        format_func=refs.property_name
     )
     
-    expenses = get_expenses(selected_prop)
+    expenses = get_expenses(selected_prop, db=read_conn)
     if expenses.empty:
         st.info("No expenses recorded for this property yet.")
     else:
@@ -348,7 +441,7 @@ elif page == "Expense Trend Dashboard":
         ).properties(
             width='container',
             height=450,
-            title=alt.TitleParams(f"Monthly Expense Trends - {prop_list[prop_list['id']==selected_prop]['name'].iloc[0]}", fontSize=16)
+            title=alt.TitleParams(f"Monthly Expense Trends - {refs.property_name(selected_prop)}", fontSize=16)
         ).configure_view(strokeWidth=0).configure_axis(labelFontSize=11, titleFontSize=13).configure_legend(labelFontSize=11, titleFontSize=13).interactive()
 
         st.altair_chart(trend_chart, use_container_width=True)
@@ -378,17 +471,87 @@ elif page == "Expense Trend Dashboard":
         col3.metric("Total Other Maintenance", f"R{total_other:,.2f}")
         col4.metric("Grand Total Expenses", f"R{grand_total:,.2f}")
 
+# ────────────────────────────────────────────────
+# CASH FLOW FORECAST
+# ────────────────────────────────────────────────
+elif page == "Cash Flow Forecast":
+    st.header("Cash Flow Forecast")
+    st.caption("Expected collections use each tenant's on-time and late payment rates over the last 12 months, "
+               "plus outstanding payment promises. Expenses follow each property's recent trend.")
+    
+    horizon = st.slider("Months ahead", min_value=MIN_HORIZON, max_value=MAX_HORIZON, value=12)
+    forecast, tenant_rates = forecast_cash_flow(read_conn, horizon)
+    if selected_property_id:
+        forecast = forecast[forecast['property_id'] == selected_property_id]
+        tenant_rates = tenant_rates[tenant_rates['property_id'] == selected_property_id]
+    
+    if forecast.empty:
+        st.info("No properties to forecast yet.")
+    else:
+        totals = forecast.groupby(['month', 'month_year'], as_index=False)[
+            ['scheduled_rent', 'expected_collections', 'promised', 'expected_expenses', 'net_cash_flow']].sum()
+        
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Scheduled Rent", f"R{totals['scheduled_rent'].sum():,.0f}")
+        col2.metric("Expected Collections", f"R{(totals['expected_collections'] + totals['promised']).sum():,.0f}")
+        col3.metric("Expected Expenses", f"R{totals['expected_expenses'].sum():,.0f}")
+        col4.metric("Net Cash Flow", f"R{totals['net_cash_flow'].sum():,.0f}")
+        
+        forecast_chart = alt.Chart(forecast).mark_line(point=True).encode(
+            x=alt.X('month:T', title='Month'),
+            y=alt.Y('net_cash_flow:Q', title='Net Cash Flow (R)'),
+            color=alt.Color('name:N', legend=alt.Legend(title="Property")),
+            tooltip=['name', 'month_year',
+                     alt.Tooltip('expected_collections:Q', title='Collections (R)', format=',.0f'),
+                     alt.Tooltip('promised:Q', title='Promised (R)', format=',.0f'),
+                     alt.Tooltip('expected_expenses:Q', title='Expenses (R)', format=',.0f'),
+                     alt.Tooltip('net_cash_flow:Q', title='Net (R)', format=',.0f')]
+        ).properties(width='container', height=400)
+        st.altair_chart(forecast_chart, use_container_width=True)
+        
+        st.subheader("Monthly Totals")
+        st.dataframe(
+            totals.drop(columns=['month']),
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "month_year": st.column_config.TextColumn("Month/Year"),
+                "scheduled_rent": st.column_config.NumberColumn("Scheduled Rent (R)", format="R%.0f"),
+                "expected_collections": st.column_config.NumberColumn("Expected Collections (R)", format="R%.0f"),
+                "promised": st.column_config.NumberColumn("Promised (R)", format="R%.0f"),
+                "expected_expenses": st.column_config.NumberColumn("Expected Expenses (R)", format="R%.0f"),
+                "net_cash_flow": st.column_config.NumberColumn("Net Cash Flow (R)", format="R%.0f")
+            }
+        )
+        
+        if not tenant_rates.empty:
+            st.subheader("Tenant Payment Behaviour")
+            tenant_rates = tenant_rates.assign(name=tenant_rates['tenant_id'].map(refs.tenant_label))
+            st.dataframe(
+                tenant_rates[['name', 'rent', 'months_observed', 'on_time_rate', 'late_rate', 'partial_rate']]
+                .sort_values('on_time_rate'),
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "name": st.column_config.TextColumn("Tenant"),
+                    "rent": st.column_config.NumberColumn("Rent (R)", format="R%.0f"),
+                    "months_observed": st.column_config.NumberColumn("Months Observed"),
+                    "on_time_rate": st.column_config.ProgressColumn("On-time Rate", min_value=0, max_value=1),
+                    "late_rate": st.column_config.ProgressColumn("Late Rate", min_value=0, max_value=1),
+                    "partial_rate": st.column_config.ProgressColumn("Partial Months", min_value=0, max_value=1)
+                }
+            )
+
 # ────────────────────────────────────────────────
 # ADD/EDIT TENANTS
 # ────────────────────────────────────────────────
 elif page == "Add/Edit Tenants":
     st.header("Manage Tenants")
     
-    prop_list = pd.read_sql_query("SELECT id, name FROM properties ORDER BY name", conn)
     selected_prop = st.selectbox(
         "Property",
-        options=prop_list['id'].tolist(),
-        format_func=lambda x: prop_list[prop_list['id']==x]['name'].iloc[0]
+        options=refs.property_ids,
+        format_func=refs.property_name
     )
     
     with st.form("Add Tenant", clear_on_submit=True):
@@ -397,6 +560,7 @@ elif page == "Add/Edit Tenants":
         rent = st.number_input("Monthly Rent (R) *", min_value=0.0, step=100.0)
         email = st.text_input("Email (optional)")
         phone = st.text_input("Phone (international format, e.g. +27831234567)")
+        move_in = st.date_input("Move-in date", value=datetime.now().date(), format="YYYY-MM-DD")
         
         submitted = st.form_submit_button("Add New Tenant")
         if submitted and name and rent > 0:
@@ -404,6 +568,7 @@ elif page == "Add/Edit Tenants":
                 INSERT INTO tenants (property_id, name, unit, rent, email, phone)
                 VALUES (?, ?, ?, ?, ?, ?)
             """, (selected_prop, name, unit, rent, email, phone))
+            start_lease(conn, cursor.lastrowid, selected_prop, unit, rent, move_in.strftime("%Y-%m-%d"), commit=False)
             conn.commit()
             st.success("Tenant added successfully")
             st.rerun()
@@ -421,6 +586,14 @@ elif page == "Add/Edit Tenants":
                 col_email, col_phone, col_btn = st.columns([2,2,1])
                 new_email = col_email.text_input("Email", value=row['email'] or "", key=f"email_{row['id']}")
                 new_phone = col_phone.text_input("Phone (+27...)", value=row['phone'] or "", key=f"phone_{row['id']}")
+                # Rent is due per month, so changes default to the 1st of next month
+                effective = st.date_input(
+                    "Unit/rent change effective from",
+                    value=(pd.Timestamp.now().normalize().replace(day=1) + pd.DateOffset(months=1)).date(),
+                    format="YYYY-MM-DD",
+                    help="A change dated mid-month is charged from the following month",
+                    key=f"effective_{row['id']}"
+                )
                 
                 if col_btn.button("Save Changes", key=f"save_{row['id']}"):
                     cursor.execute("""
@@ -428,11 +601,35 @@ elif page == "Add/Edit Tenants":
                         WHERE id=?
                     """, (new_name, new_unit, new_rent, new_email, new_phone, row['id']))
                     conn.commit()
+                    change_lease_terms(conn, row['id'], new_unit, new_rent, effective.strftime("%Y-%m-%d"))
                     st.success("Tenant updated")
                     st.rerun()
                 
+                current_lease = get_current_lease(conn, row['id'])
+                if not current_lease.empty:
+                    lease_start = datetime.strptime(current_lease['move_in'].iloc[0][:10], "%Y-%m-%d").date()
+                    col_out_date, col_out_btn = st.columns([2, 1])
+                    move_out = col_out_date.date_input(
+                        f"Move-out date (lease since {lease_start})",
+                        value=max(datetime.now().date(), lease_start),
+                        min_value=lease_start,
+                        format="YYYY-MM-DD",
+                        key=f"move_out_{row['id']}"
+                    )
+                    if col_out_btn.button("Move Out", key=f"move_out_btn_{row['id']}"):
+                        try:
+                            end_lease(conn, row['id'], move_out.strftime("%Y-%m-%d"))
+                        except ValueError as e:
+                            st.error(str(e))
+                        else:
+                            st.success("Lease ended – payment history kept")
+                            st.rerun()
+                else:
+                    st.caption("No active lease (moved out)")
+                
                 if st.button("Delete Tenant", key=f"del_{row['id']}"):
                     cursor.execute("DELETE FROM tenants WHERE id=?", (row['id'],))
+                    cursor.execute("DELETE FROM leases WHERE tenant_id=?", (row['id'],))
                     cursor.execute("DELETE FROM payments WHERE tenant_id=?", (row['id'],))
                     cursor.execute("DELETE FROM notes WHERE tenant_id=?", (row['id'],))
                     cursor.execute("DELETE FROM maintenance_photos WHERE note_id IN (SELECT id FROM notes WHERE tenant_id=?)", (row['id'],))
@@ -442,7 +639,7 @@ elif page == "Add/Edit Tenants":
                 
                 st.subheader("Notes")
                 note_type_filter = st.selectbox("Filter by type", ["All", "Payment Excuse", "Maintenance Needed", "Late Payment Notice"], key=f"filter_tenant_{row['id']}")
-                notes = get_notes(row['id'], note_type_filter)
+                notes = get_notes(tenant_id=row['id'], note_type=note_type_filter)
 
                 if not notes.empty:
                     for _, note in notes.iterrows():
@@ -582,7 +779,7 @@ elif page == "Notes Overview":
 
     note_type_filter = st.selectbox("Filter by note type", ["All", "Payment Excuse", "Maintenance Needed", "Late Payment Notice"])
 
-    notes = get_notes(selected_property_id)
+    notes = get_notes(selected_property_id, db=read_conn)
 
     if notes.empty:
         st.info("No notes found matching the filter.")
@@ -648,7 +845,7 @@ elif page == "Notes Overview":
         st.subheader("All Notes")
         enhanced_notes = notes.copy()
         enhanced_notes['Photos'] = enhanced_notes['id'].apply(
-            lambda nid: len(get_photos_for_note(nid)) if get_photos_for_note(nid).shape[0] > 0 else 0
+            lambda nid: len(get_photos_for_note(nid, db=read_conn))
         )
         st.dataframe(
             enhanced_notes[['name', 'unit', 'note_date', 'note_type', 'note_text', 'Photos']],
@@ -665,13 +862,11 @@ elif page == "Notes Overview":
 elif page == "Record Payment":
     st.header("Record a Payment")
     
-    tenants = get_tenants(selected_property_id)
-    if tenants.empty:
+    tenant_ids = refs.tenant_options(selected_property_id)
+    if not tenant_ids:
         st.warning("No tenants yet. Add some first!")
     else:
-        tenant_dict = {f"{r['name']} ({r['unit'] or 'No unit'})": r['id'] for _, r in tenants.iterrows()}
-        selected = st.selectbox("Tenant", list(tenant_dict.keys()))
-        tenant_id = tenant_dict.get(selected)
+        tenant_id = st.selectbox("Tenant", tenant_ids, format_func=refs.tenant_label)
         
         with st.form("Payment"):
             col1, col2 = st.columns(2)
@@ -688,7 +883,7 @@ elif page == "Record Payment":
                     cursor.execute("""
                         INSERT INTO payments (tenant_id, property_id, payment_date, month_year, amount, method)
                         VALUES (?, ?, ?, ?, ?, ?)
-                    """, (tenant_id, selected_property_id, payment_date, month_year, amount, method))
+                    """, (tenant_id, refs.tenants[tenant_id]['property_id'], payment_date, month_year, amount, method))
                     conn.commit()
                     st.success("Payment recorded successfully")
                     st.rerun()
@@ -704,22 +899,16 @@ elif page == "Monthly Report":
     current_month = datetime.now().strftime("%b %Y")
     month_input = st.text_input("Month/Year (e.g. Feb 2026)", value=current_month)
     
+    # Keep the report open across reruns so the chart controls below stay usable
     if st.button("Generate Report"):
-        query = '''
-        SELECT t.id, t.name, t.unit, t.rent, t.phone, t.email,
-               COALESCE(SUM(p.amount), 0) as total_paid,
-               (t.rent - COALESCE(SUM(p.amount), 0)) as balance,
-               CASE WHEN (t.rent - COALESCE(SUM(p.amount), 0)) > 0 THEN 'Overdue' 
-                    WHEN (t.rent - COALESCE(SUM(p.amount), 0)) = 0 THEN 'Paid' 
-                    ELSE 'Overpaid' END as status,
-               ? as month_year
-        FROM tenants t
-        LEFT JOIN payments p ON t.id = p.tenant_id AND p.month_year = ?
-        WHERE t.property_id = COALESCE(?, t.property_id)
-        GROUP BY t.id
-        ORDER BY t.name
-        '''
-        df = pd.read_sql_query(query, conn, params=(month_input, month_input, selected_property_id))
+        try:
+            datetime.strptime(month_input, "%b %Y")
+        except ValueError:
+            st.error("Enter the month as e.g. Feb 2026")
+        else:
+            st.session_state['report_month'] = month_input
+    if st.session_state.get('report_month') == month_input:
+        df = cached_report(read_conn, 'monthly_report', month_input, selected_property_id, store=read_conn is conn)
         
         def highlight_overdue(row):
             return ['background-color: #ffcccc' if row['balance'] > 0 else '' for _ in row]
@@ -743,28 +932,27 @@ elif page == "Monthly Report":
         
         if not df.empty:
             st.subheader("Rent Collection Breakdown")
-            chart_data = df[['name', 'rent', 'total_paid', 'balance']].copy()
-            chart_data = chart_data.melt(id_vars=['name'], 
-                                         value_vars=['rent', 'total_paid', 'balance'],
-                                         var_name='Category',
-                                         value_name='Amount (R)')
-            chart_data['Category'] = chart_data['Category'].map({
-                'rent': 'Due',
-                'total_paid': 'Paid',
-                'balance': 'Arrears'
-            })
+            col_group, col_top = st.columns([2, 1])
+            group_label = col_group.selectbox("Group by", list(GROUP_OPTIONS.keys()))
+            group_by = GROUP_OPTIONS[group_label]
+            top_n = MAX_GROUPS - 1
+            if group_by in TOP_N_GROUPS:
+                top_n = col_top.number_input("Top N", min_value=1, max_value=MAX_GROUPS - 1, value=15, step=1)
+            chart_data = collection_chart_data(read_conn, month_input, selected_property_id,
+                                               group_by=group_by, top_n=top_n)
             
-            line_chart = alt.Chart(chart_data).mark_line(point=alt.OverlayMarkDef(filled=True, size=80)).encode(
-                x=alt.X('name:N', title='Tenant', axis=alt.Axis(labelAngle=-45)),
-                y=alt.Y('Amount (R):Q', title='Amount (R)'),
-                color=alt.Color('Category:N', legend=alt.Legend(title="Category")),
-                tooltip=['name', 'Category', 'Amount (R)']
+            bar_chart = alt.Chart(chart_data).mark_bar().encode(
+                y=alt.Y('Group:N', title=None, sort=alt.EncodingSortField(field='order', order='ascending')),
+                yOffset=alt.YOffset('Category:N', sort=['Due', 'Paid', 'Arrears']),
+                x=alt.X('Amount (R):Q', title='Amount (R)'),
+                color=alt.Color('Category:N', sort=['Due', 'Paid', 'Arrears'], legend=alt.Legend(title="Category")),
+                tooltip=['Group', 'Category', 'Tenants', alt.Tooltip('Amount (R):Q', format=',.2f')]
             ).properties(
                 width='container',
-                height=450
-            ).interactive()
+                height=alt.Step(8)
+            )
 
-            st.altair_chart(line_chart, use_container_width=True)
+            st.altair_chart(bar_chart, use_container_width=True)
 
         csv_buffer = io.StringIO()
         df.to_csv(csv_buffer, index=False)
@@ -804,6 +992,25 @@ elif page == "Monthly Report":
             - Sort/filter the table by clicking column headers
             """)
 
+        st.subheader("Tenant Statements")
+        st.caption("One statement per tenant: rent due, payments received, balance carried forward and recent notes. "
+                   "Balances carried forward come from the month-close job.")
+        if st.button("Generate Statements"):
+            try:
+                with st.spinner("Rendering statements..."):
+                    zip_bytes, statement_count = statements_zip_bytes(read_conn, month_input, selected_property_id)
+                st.session_state['statements_zip'] = (month_input, zip_bytes, statement_count)
+            except ValueError:
+                st.error("Enter the month as e.g. Feb 2026 to generate statements")
+        if st.session_state.get('statements_zip', (None,))[0] == month_input:
+            _, zip_bytes, statement_count = st.session_state['statements_zip']
+            st.download_button(
+                label=f"Download {statement_count} Statements (ZIP)",
+                data=zip_bytes,
+                file_name=f"statements_{month_input.replace(' ', '_')}.zip",
+                mime="application/zip"
+            )
+
 # ────────────────────────────────────────────────
 # PAYMENT HISTORY
 # ────────────────────────────────────────────────